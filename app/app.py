@@ -1,15 +1,43 @@
 import streamlit as st
-import os, json
+import os, re, json, uuid
 
-from app.page import GenerateExamPage, PageEnum, QuestionsPage, ResultsPage, QuestionBrowse, EditJson
+from app.page import (
+    GenerateExamPage, PageEnum, QuestionsPage, ResultsPage, QuestionBrowse, EditJson, AdaptiveQuestionsPage,
+    MyQuestion
+)
+from model.question import Question
+from utils.adaptive import ItemPool
+from utils.api import get_questions, request_questions
+from utils.bank import open_bank
+from utils.snapshot import SnapshotStore
+from utils.warm_pool import WarmPool
+
+SESSION_PARAM = "session"
+APP_KEY = "app"
+
+@st.cache_resource
+def get_shared_resources():
+    """
+    Create the resources shared by all the sessions if they don't exist yet (for the lifetime of the
+    process: a new warm pool would leave the worker of the previous one generating exams for nobody)
+    :return: Item pool, warm pool, snapshot store and packed bank (None if the questions are not packed)
+    """
+    bank = open_bank(os.path.join('.', 'bank'))
+    return (
+        ItemPool(os.path.join('.', 'Questions'), os.path.join('.', 'item_stats.json'), bank),
+        WarmPool(get_questions, refill=request_questions),
+        SnapshotStore(os.path.join('.', 'sessions')),
+        bank,
+    )
 
-@st.cache_resource(ttl=60 * 60 * 24)
 def get_app():
     """
-    Create a new app instance if it doesn't exist yet
+    Create a new app instance for the current session if it doesn't exist yet
     :return: App instance
     """
-    return App()
+    if APP_KEY not in st.session_state:
+        st.session_state[APP_KEY] = App()
+    return st.session_state[APP_KEY]
 
 class App:
     """
@@ -25,10 +53,14 @@ class App:
             PageEnum.RESULTS: ResultsPage(),
             PageEnum.QUESTION_BROWSE: QuestionBrowse(self.question_folder),
             PageEnum.EDIT_JSON: EditJson(self.question_folder),
+            PageEnum.ADAPTIVE_EXAM: AdaptiveQuestionsPage(),
         }
+        self.item_pool, self.warm_pool, self.snapshots, self.bank = get_shared_resources()
+        self.session_id = None
 
         self.current_page = self.pages[PageEnum.GENERATE_EXAM]
 
+        self.exam = None
         self._questions = None
         self._answers = {}
 
@@ -36,8 +68,104 @@ class App:
         """
         Render the app
         """
+        self.__resume()
         self.current_page.render(self)
 
+    def __resume(self):
+        """
+        Identify the session (by a query parameter) and, if there is no exam in progress (e.g. after
+        a restart), restore the exam of the session from its snapshot
+        """
+        session_id = st.query_params.get(SESSION_PARAM)
+        if session_id is None or not re.fullmatch(r"[0-9a-f]{32}", session_id):
+            session_id = uuid.uuid4().hex
+            st.query_params[SESSION_PARAM] = session_id
+
+        if session_id == self.session_id or self._questions is not None:
+            return
+
+        self.session_id = session_id
+        snapshot = self.snapshots.load(session_id)
+        if snapshot is None:
+            return
+
+        papers = {}
+        questions = []
+        for index, (paper, question_id) in enumerate(snapshot.refs):
+            try:
+                question = self.__stored_question(paper, question_id, papers)
+            except (OSError, ValueError, KeyError) as e:
+                print(e)
+                return
+
+            if question is None:
+                return
+
+            number = index + 1 if snapshot.renumbered else question.id
+            questions.append(Question(number, question.question, question.answers, question.correct_answer))
+
+        self.exam = snapshot.exam
+        self._questions = questions
+        self._answers = dict(snapshot.answers)
+        self.pages[PageEnum.QUESTIONS].number_of_question = snapshot.number_of_question
+
+        if snapshot.page == PageEnum.ADAPTIVE_EXAM:
+            keys = [(os.path.join(self.question_folder, paper), question_id) for paper, question_id in snapshot.refs]
+            self.pages[PageEnum.ADAPTIVE_EXAM].restore(self, keys)
+
+        if snapshot.page is not None:
+            self.current_page = self.pages[snapshot.page]
+
+    def __stored_question(self, paper: str, question_id: int, papers: dict):
+        """
+        Read a stored question, from the packed bank if it holds the current version of the paper
+        (only that question is decoded), otherwise from the paper itself
+        :param paper: Path of the paper relative to the question folder
+        :param question_id: Id of the question in the paper
+        :param papers: Bank ids (if packed) or questions of the papers already read, by paper
+        :return: Question, None if it is not in the paper
+        """
+        if paper not in papers:
+            path = os.path.join(self.question_folder, paper)
+            ids = None
+            if self.bank is not None:
+                stat = os.stat(path)
+                ids = self.bank.ids(paper, stat.st_mtime_ns, stat.st_size)
+
+            if ids is not None:
+                papers[paper] = (ids, None)
+            else:
+                papers[paper] = (None, {question.id: question for question in MyQuestion().read_json(self, path)})
+
+        ids, stored = papers[paper]
+        if ids is not None:
+            return self.bank.get(ids[question_id]) if question_id in ids else None
+        return stored.get(question_id)
+
+    def start_exam(self, exam: str, paper: str = None):
+        """
+        Start the snapshot of a new exam
+        :param exam: Name of the exam
+        :param paper: Paper the questions are stored in, None if they are added with add_question
+        """
+        self.exam = exam
+
+        refs = []
+        if paper is not None:
+            refs = [(os.path.relpath(paper, self.question_folder), question.id) for question in self._questions]
+
+        self.snapshots.start(self.session_id, exam, refs, renumbered=paper is None)
+
+    def add_question(self, question, paper: str, question_id: int):
+        """
+        Add a question to the exam
+        :param question: Question to add
+        :param paper: Paper the question is stored in
+        :param question_id: Id of the question in the paper
+        """
+        self._questions.append(question)
+        self.snapshots.add_question(self.session_id, (os.path.relpath(paper, self.question_folder), question_id))
+
     @property
     def questions(self):
         return self._questions
@@ -52,8 +180,19 @@ class App:
         :param question_index: index of the question
         :param answer_index: index of the answer
         """
+        if self._answers.get(question_index) != answer_index:
+            self.snapshots.record_answer(self.session_id, question_index, answer_index)
+
         self._answers[question_index] = answer_index
 
+    def set_question_number(self, number_of_question: int):
+        """
+        Change the current question of the questions page
+        :param number_of_question: Index of the question
+        """
+        self.pages[PageEnum.QUESTIONS].number_of_question = number_of_question
+        self.snapshots.record_question_number(self.session_id, number_of_question)
+
     def get_answer(self, question_index: int):
         """
         Get the answer for a question
@@ -68,6 +207,11 @@ class App:
         :param page: Page to change to
         """
         self.current_page = self.pages[page]
+        if page == PageEnum.RESULTS:
+            # The exam is finished, there is nothing left to resume
+            self.snapshots.delete(self.session_id)
+        else:
+            self.snapshots.record_page(self.session_id, page)
         #st.experimental_rerun()
         st.rerun()
 
@@ -75,10 +219,14 @@ class App:
         """
         Reset the app
         """
+        self.exam = None
         self._questions = None
         self._answers = {}
+        self.snapshots.delete(self.session_id)
         self.pages[PageEnum.QUESTIONS].number_of_question = 0
         self.pages[PageEnum.RESULTS].clarifications = {}
+        self.pages[PageEnum.RESULTS].prefetch = None
+        self.pages[PageEnum.ADAPTIVE_EXAM].reset()
         self.current_page = self.pages[PageEnum.GENERATE_EXAM]
 
         #st.experimental_rerun()
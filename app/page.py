@@ -1,4 +1,6 @@
-import os, re, json
+import io, os, re, json
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from dataclasses import replace
 from datetime import datetime
 from abc import abstractmethod
 from typing import Optional
@@ -6,7 +8,9 @@ from typing import Optional
 import streamlit as st
 
 from model.question import Question
-from utils.api import get_questions, clarify_question
+from utils.adaptive import AbilityEstimate
+from utils.api import clarify_question, clarify_questions
+from utils.export import EXPORT_FORMATS, write_export
 from utils.generate_document import questions_to_pdf
 
 class PageEnum:
@@ -18,6 +22,7 @@ class PageEnum:
     RESULTS = 2
     QUESTION_BROWSE = 3
     EDIT_JSON = 4
+    ADAPTIVE_EXAM = 5
 
 
 class Page:
@@ -77,11 +82,21 @@ class GenerateExamPage(Page):
         if st.button("Edit Questions", help="Edit previously generated questions"):
                     app.change_page(PageEnum.EDIT_JSON)
 
+        if st.button("Adaptive exam", help="Take an exam that adapts to your answers using the stored questions"):
+                    app.questions = []
+                    app.start_exam("Adaptive exam")
+                    app.change_page(PageEnum.ADAPTIVE_EXAM)
+
         if st.button("Generate", help="Generate the questions according to the parameters"):
 
             st.warning("Generating questions. This may take a while...")
             try:
-                app.questions = get_questions(topics, number_of_questions, number_of_answers)
+                app.questions = app.warm_pool.get_questions(topics, number_of_questions, number_of_answers)
+                #print(app.questions)
+                myq=MyQuestion()
+                paper = myq.write_json(app,topics)
+                app.item_pool.invalidate()
+                app.start_exam(paper, paper)
             except Exception as e:
                 print(e)
                 st.error("An error occurred while generating the questions. Please try again")
@@ -93,10 +108,6 @@ class GenerateExamPage(Page):
                 f"can download the questions as a PDF file or take the exam in the app."
             )
 
-            #print(app.questions)
-            myq=MyQuestion()
-            myq.write_json(app,topics)
-
             left, center, right = st.columns(3)
 
             with left:
@@ -110,6 +121,19 @@ class GenerateExamPage(Page):
                     help="Download the questions as a PDF file"
                 )
 
+            with center:
+                export_format = st.selectbox("Export format", list(EXPORT_FORMATS))
+                with io.StringIO() as stream:
+                    write_export(app.questions, export_format, stream)
+                    data = stream.getvalue()
+                st.download_button(
+                    "Export",
+                    data=data,
+                    file_name=f"questions.{EXPORT_FORMATS[export_format].extension}",
+                    mime=EXPORT_FORMATS[export_format].mime,
+                    help="Export the questions as a handout, an answer key or for an LMS"
+                )
+
             with right:
                 if st.button("Start exam", help="Start the exam"):
                     app.change_page(PageEnum.QUESTIONS)
@@ -137,7 +161,7 @@ class QuestionsPage(Page):
         if self.number_of_question != 0:
             with left:
                 if st.button("Previous", help="Go to the previous question"):
-                    self.__change_question(self.number_of_question - 1)
+                    self.__change_question(app, self.number_of_question - 1)
 
         with center:
             if st.button("Finish", help="Finish the exam and go to the results page"):
@@ -146,7 +170,7 @@ class QuestionsPage(Page):
         if self.number_of_question != len(app.questions) - 1:
             with right:
                 if st.button("Next", help="Go to the next question"):
-                    self.__change_question(self.number_of_question + 1)
+                    self.__change_question(app, self.number_of_question + 1)
 
     @staticmethod
     def __render_question(question: Question, index_answer: Optional[int]) -> int:
@@ -168,15 +192,107 @@ class QuestionsPage(Page):
 
         return index
 
-    def __change_question(self, index: int):
+    def __change_question(self, app, index: int):
         """
         Change the current question and rerun the app
+        :param app: App instance
         :param index: Index of the question to change to
         """
-        self.number_of_question = index
+        app.set_question_number(index)
         #st.experimental_rerun()
         st.rerun()
 
+class AdaptiveQuestionsPage(Page):
+
+    max_questions = 30
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        Reset the state of the adaptive exam
+        """
+        self.estimate = AbilityEstimate()
+        self.asked = set()
+        self.current = None
+
+    def restore(self, app, keys):
+        """
+        Restore the state of an adaptive exam in progress
+        :param app: App instance
+        :param keys: Keys of the items already asked, in order
+        """
+        app.item_pool.load()
+        self.reset()
+
+        for index, key in enumerate(keys):
+            self.asked.add(key)
+            if key in app.item_pool.difficulties:
+                correct = app.questions[index].correct_answer == app.get_answer(index)
+                self.estimate.update(app.item_pool.difficulties[key], correct)
+
+    def render(self, app):
+        """
+        Render the page
+        """
+        st.title("Adaptive exam")
+
+        app.item_pool.load()
+
+        if self.current not in app.item_pool.questions:
+            self.current = app.item_pool.next_item(self.estimate.ability, self.asked)
+
+        if self.current is None:
+            st.info("There are no more questions available in the question bank.")
+            self.__render_finish(app)
+            return
+
+        question = app.item_pool.questions[self.current]
+
+        st.write(f"Question {len(app.questions) + 1}")
+        st.write(question.question)
+
+        answer = st.radio("Answer", question.answers, index=0, key=f"adaptive_{len(app.questions)}")
+
+        left, center, right = st.columns(3)
+
+        with center:
+            self.__render_finish(app)
+
+        with right:
+            if st.button("Submit", help="Submit the answer and go to the next question"):
+                self.__submit(app, question, question.answers.index(answer))
+
+    def __submit(self, app, question: Question, answer_index: int):
+        """
+        Record the answer, update the estimates and pick the next question
+        :param app: App instance
+        :param question: Question that has been answered
+        :param answer_index: Index of the answer selected by the user
+        """
+        app.item_pool.record_attempt(self.current, self.estimate, question.correct_answer == answer_index)
+        app.item_pool.save()
+
+        app.add_question(replace(question, id=len(app.questions) + 1), *self.current)
+        app.add_answer(len(app.questions) - 1, answer_index)
+        self.asked.add(self.current)
+        self.current = None
+
+        if self.estimate.is_reliable() or len(app.questions) >= self.max_questions:
+            app.change_page(PageEnum.RESULTS)
+
+        st.rerun()
+
+    @staticmethod
+    def __render_finish(app):
+        if app.questions and st.button("Finish", help="Finish the exam and go to the results page"):
+            app.change_page(PageEnum.RESULTS)
+
+        if st.button("Go Back", help="Leave the exam and go back to the start page"):
+            app.reset()
+
+
 import configparser
 import smtplib, ssl
 from email.mime.multipart import MIMEMultipart
@@ -229,8 +345,13 @@ def send_email(app, num_correct):
 
 class ResultsPage:
 
+    executor = ThreadPoolExecutor(max_workers=4)
+    # Seconds to wait for the prefetched clarifications before clarifying the question alone
+    prefetch_timeout = 30
+
     def __init__(self):
         self.clarifications = {}
+        self.prefetch = None
 
     def render(self, app):
         """
@@ -238,6 +359,9 @@ class ResultsPage:
         """
         st.title("Results")
 
+        if self.prefetch is None:
+            self.__prefetch_clarifications(app)
+
         num_correct = self.__get_correct_answers(app)
 
         st.write(f"### Number of questions: {len(app.questions)}")
@@ -304,12 +428,44 @@ class ResultsPage:
         if not clarify_button:
             return
 
+        if question.id not in self.clarifications and self.prefetch is not None:
+            if self.prefetch.running():
+                with st.spinner("Preparing the clarifications..."):
+                    try:
+                        self.prefetch.result(timeout=self.prefetch_timeout)
+                    except TimeoutError:
+                        pass
+            else:
+                # Still queued behind the prefetches of other sessions: clarifying the question on
+                # its own is faster than waiting for a worker
+                self.prefetch.cancel()
+
         if question.id not in self.clarifications:
             st.warning("This can take a while...")
             self.clarifications[question.id] = clarify_question(question)
 
         st.write(self.clarifications[question.id])
 
+    def __prefetch_clarifications(self, app):
+        """
+        Clarify all the incorrectly answered questions in the background
+        :param app: App instance
+        """
+        incorrect = [
+            question for index, question in enumerate(app.questions)
+            if question.correct_answer != app.get_answer(index)
+        ]
+
+        # Keep a reference to the dictionary so that a prefetch of a previous exam cannot fill the
+        # clarifications of the current one
+        clarifications = self.clarifications
+
+        def prefetch():
+            for question_id, clarification in clarify_questions(incorrect).items():
+                clarifications.setdefault(question_id, clarification)
+
+        self.prefetch = self.executor.submit(prefetch)
+
     @staticmethod
     def __get_correct_answers(app):
         """
@@ -343,7 +499,7 @@ class QuestionBrowse:
                    # Display file contents or perform actions
                    myq = MyQuestion()
                    app.questions = myq.read_json(app, item_path)
-                   app.exam = item_path
+                   app.start_exam(item_path, item_path)
                    app.change_page(PageEnum.QUESTIONS)
                elif os.path.isdir(item_path):
                    self.folder_path = item_path  # Update current folder
@@ -401,6 +557,7 @@ class EditJson:
                         new_file_path = os.path.join(self.folder_path, new_file_name)
                         self.rename_file(file_path, new_file_path)
                         st.success("File renamed successfully.")
+                    app.item_pool.invalidate()
 
                 except json.JSONDecodeError as e:
                     st.error("Invalid JSON format. Please correct the JSON content before saving.")
@@ -449,8 +606,10 @@ class MyQuestion:
 
     def write_json(self, app, topics):
         json_data = json.dumps([self.to_dict(question) for question in app.questions], indent=4)
-        with open(app.question_folder + os.sep + self.append_timestamp(self.sanitize_file_name(topics) + '.json'), "w", encoding="utf-8") as f:
+        question_file = app.question_folder + os.sep + self.append_timestamp(self.sanitize_file_name(topics) + '.json')
+        with open(question_file, "w", encoding="utf-8") as f:
                 f.write(json_data)
+        return question_file
 
     def sanitize_file_name(self,file_name):
         # Replace characters not allowed in file names with underscores
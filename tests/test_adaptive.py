@@ -0,0 +1,130 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from utils.adaptive import DEFAULT_DIFFICULTY, AbilityEstimate, ItemPool
+
+
+def write_paper(path: str, number_of_questions: int, first_id: int = 1):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump([
+            {"id": first_id + index, "question": f"Question {first_id + index}?", "answers": ["A", "B"], "correct_answer": 0}
+            for index in range(number_of_questions)
+        ], f, indent=4)
+
+
+class ItemPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.folder = os.path.join(temp_dir.name, "Questions")
+        os.makedirs(self.folder)
+        self.paper = os.path.join(self.folder, "paper.json")
+        self.stats_file = os.path.join(temp_dir.name, "item_stats.json")
+        write_paper(self.paper, 20)
+
+        self.pool = ItemPool(self.folder, self.stats_file)
+        self.pool.load()
+
+    def assert_index_consistent(self):
+        self.assertEqual(self.pool._index, sorted((d, key) for key, d in self.pool.difficulties.items()))
+
+    def test_next_item_is_the_closest_not_excluded(self):
+        for number, key in enumerate(sorted(self.pool.questions)):
+            self.pool.difficulties[key] = float(number)
+        self.pool._index = sorted((d, key) for key, d in self.pool.difficulties.items())
+
+        self.assertEqual(self.pool.next_item(4.2, set()), (self.paper, 5))
+        self.assertEqual(self.pool.next_item(4.2, {(self.paper, 5)}), (self.paper, 6))
+        self.assertEqual(self.pool.next_item(-10, set()), (self.paper, 1))
+        self.assertIsNone(self.pool.next_item(0, set(self.pool.questions)))
+
+    def test_record_attempt_updates_ability_and_difficulty(self):
+        key = (self.paper, 1)
+        estimate = AbilityEstimate()
+
+        self.pool.record_attempt(key, estimate, True)
+
+        self.assertGreater(estimate.ability, 0)
+        self.assertLess(self.pool.difficulties[key], DEFAULT_DIFFICULTY)
+        self.assertEqual(self.pool.attempts[key], 1)
+        self.assert_index_consistent()
+
+    def test_concurrent_attempts_keep_the_index_consistent(self):
+        errors = []
+
+        def student(number):
+            try:
+                estimate, asked = AbilityEstimate(), set()
+                for attempt in range(15):
+                    key = self.pool.next_item(estimate.ability, asked)
+                    asked.add(key)
+                    self.pool.record_attempt(key, estimate, (number + attempt) % 3 != 0)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=student, args=(number,)) for number in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(self.pool), 20)
+        self.assertEqual(sum(self.pool.attempts.values()), 8 * 15)
+        self.assert_index_consistent()
+
+    def test_load_only_parses_the_changed_papers_once_invalidated(self):
+        key = (self.paper, 1)
+        self.pool.record_attempt(key, AbilityEstimate(), True)
+        difficulty = self.pool.difficulties[key]
+        other = os.path.join(self.folder, "other.json")
+        write_paper(other, 5, first_id=1)
+
+        # The folder is not scanned again until the app signals a change
+        self.pool.load()
+        self.assertEqual(len(self.pool), 20)
+
+        self.pool.invalidate()
+        with mock.patch("utils.adaptive.json.load", wraps=json.load) as parse:
+            self.pool.load()
+        self.assertEqual(parse.call_count, 1)  # only the new paper
+        self.assertEqual(len(self.pool), 25)
+        self.assertEqual(self.pool.difficulties[key], difficulty)
+
+        write_paper(self.paper, 10)
+        os.remove(other)
+        self.pool.invalidate()
+        self.pool.load()
+        self.assertEqual(len(self.pool), 10)
+        self.assertEqual(self.pool.difficulties[key], difficulty)
+        self.assertNotIn((self.paper, 11), self.pool.questions)
+        self.assertNotIn((other, 1), self.pool.questions)
+        self.assert_index_consistent()
+
+    def test_statistics_round_trip(self):
+        key = (self.paper, 3)
+        self.pool.record_attempt(key, AbilityEstimate(), False)
+        self.pool.save()
+
+        loaded = ItemPool(self.folder, self.stats_file)
+        loaded.load()
+        self.assertEqual(loaded.difficulties[key], self.pool.difficulties[key])
+        self.assertEqual(loaded.attempts[key], 1)
+        self.assertEqual(sorted(os.listdir(os.path.dirname(self.stats_file))), ["Questions", "item_stats.json"])
+
+        # A corrupt statistics file is ignored instead of breaking the adaptive exam
+        with open(self.stats_file, "w", encoding="utf-8") as f:
+            f.write('{"paper.json#3": {"diffi')
+        corrupt = ItemPool(self.folder, self.stats_file)
+        corrupt.load()
+        self.assertEqual(corrupt.difficulties[key], DEFAULT_DIFFICULTY)
+        self.assertEqual(len(corrupt), 20)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import json
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+
+from utils.adaptive import ItemPool
+from utils.bank import INDEX_FILE, BankWriter, PackedBank, export_json, open_bank, pack_folder
+
+
+def write_paper(path: str, questions: list):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump([
+            {"id": question_id, "question": f"Question {question_id}?", "answers": ["Yes", "No"], "correct_answer": question_id % 2}
+            for question_id in questions
+        ], f, indent=4)
+
+
+class PackedBankTest(unittest.TestCase):
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.root = temp_dir.name
+        self.folder = os.path.join(self.root, "Questions")
+        os.makedirs(os.path.join(self.folder, "Math"))
+        write_paper(os.path.join(self.folder, "python.json"), [1, 2, 3])
+        write_paper(os.path.join(self.folder, "Math", "algebra.json"), [1, 2])
+        self.path = os.path.join(self.root, "bank")
+
+        # Small segments, so that the questions are spread over several segment files
+        self.assertEqual(pack_folder(self.folder, self.path, segment_size=128), 5)
+        self.bank = PackedBank(self.path)
+        self.addCleanup(self.bank.close)
+
+    def test_round_trip(self):
+        self.assertEqual(len(self.bank), 5)
+        self.assertGreater(len([f for f in os.listdir(self.path) if f.startswith("segment-")]), 1)
+
+        record = self.bank.record(0)
+        self.assertEqual(record["paper"], "python.json")
+        question = self.bank.get(4)
+        self.assertEqual((question.id, question.question, question.answers, question.correct_answer), (2, "Question 2?", ["Yes", "No"], 0))
+        self.assertEqual(self.bank.record(4)["paper"], os.path.join("Math", "algebra.json"))
+        with self.assertRaises(IndexError):
+            self.bank.get(5)
+
+        sample = self.bank.sample(3, random.Random(0))
+        self.assertEqual(len(sample), 3)
+        self.assertEqual(len(self.bank.sample(10)), 5)
+
+    def test_ids_of_current_papers(self):
+        paper = os.path.join(self.folder, "python.json")
+        stat = os.stat(paper)
+
+        ids = self.bank.ids("python.json", stat.st_mtime_ns, stat.st_size)
+        self.assertEqual(ids, {1: 0, 2: 1, 3: 2})
+        self.assertEqual(self.bank.get(ids[2]).question, "Question 2?")
+        self.assertIsNone(self.bank.ids("python.json", stat.st_mtime_ns + 1, stat.st_size))
+        self.assertIsNone(self.bank.ids("missing.json", stat.st_mtime_ns, stat.st_size))
+
+        # The item pool reads the packed papers from the bank, and the other ones from their file
+        write_paper(os.path.join(self.folder, "Math", "algebra.json"), [1, 2, 7])
+        pool = ItemPool(self.folder, os.path.join(self.root, "item_stats.json"), self.bank)
+        with mock.patch("utils.adaptive.json.load", wraps=json.load) as parse:
+            pool.load()
+        self.assertEqual(parse.call_count, 1)
+        self.assertEqual(len(pool), 6)
+        self.assertEqual(pool.questions[(paper, 3)].question, "Question 3?")
+
+    def test_export_json(self):
+        output_file = os.path.join(self.root, "export.json")
+        export_json(self.bank, output_file, [4, 0])
+
+        with open(output_file, "r", encoding="utf-8") as f:
+            exported = json.load(f)
+        self.assertEqual(exported, [
+            {"id": 1, "question": "Question 2?", "answers": ["Yes", "No"], "correct_answer": 0},
+            {"id": 2, "question": "Question 1?", "answers": ["Yes", "No"], "correct_answer": 1},
+        ])
+
+        export_json(self.bank, output_file)
+        with open(output_file, "r", encoding="utf-8") as f:
+            self.assertEqual(len(json.load(f)), 5)
+
+    def test_failed_write_leaves_no_bank(self):
+        self.assertEqual(self.bank.get(4).question, "Question 2?")
+
+        with self.assertRaises(RuntimeError):
+            with BankWriter(self.path) as writer:
+                writer.add({"id": 1, "question": "Question?", "answers": [], "correct_answer": 0})
+                raise RuntimeError("interrupted")
+
+        self.assertFalse(os.path.exists(os.path.join(self.path, INDEX_FILE)))
+        self.assertIsNone(open_bank(self.path))
+        # The bank opened before keeps reading the segments it has mapped
+        self.assertEqual(self.bank.get(4).question, "Question 2?")
+
+
+if __name__ == "__main__":
+    unittest.main()
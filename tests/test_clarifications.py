@@ -0,0 +1,91 @@
+import json
+import re
+import threading
+import unittest
+from unittest import mock
+
+import openai
+
+from model.question import Question
+from utils import api
+from utils.api import CLARIFICATION_BATCH_SIZE, clarify_batch, clarify_questions
+
+
+class ClarificationBackend:
+    """
+    Local fake of openai.ChatCompletion.create explaining the questions of a batch, in reverse
+    order and with string ids
+    """
+
+    def __init__(self, fail_on: int = None, skip: int = None):
+        self.fail_on = fail_on
+        self.skip = skip
+        self.prompts = []
+        self._lock = threading.Lock()
+
+    def __call__(self, model, messages, response_format=None, **kwargs):
+        prompt = messages[-1]["content"]
+        with self._lock:
+            self.prompts.append(prompt)
+
+        question_ids = [int(question_id) for question_id in re.findall(r"Question id (\d+)\.", prompt)]
+        if self.fail_on in question_ids:
+            raise openai.error.APIError("Backend error")
+
+        content = json.dumps({"clarifications": [
+            {"id": str(question_id), "explanation": f"Explanation {question_id}"}
+            for question_id in reversed(question_ids) if question_id != self.skip
+        ]})
+        return {"choices": [{"message": {"content": content}}]}
+
+
+def questions(count: int) -> list:
+    return [Question(number, f"Question {number}?", ["Yes", "No"], number % 2) for number in range(1, count + 1)]
+
+
+class ClarificationsTest(unittest.TestCase):
+
+    def clarify(self, backend: ClarificationBackend, count: int) -> dict:
+        with mock.patch.object(openai.ChatCompletion, "create", backend), mock.patch("builtins.print"):
+            return clarify_questions(questions(count))
+
+    def test_questions_are_clarified_in_batches(self):
+        backend = ClarificationBackend()
+        count = 2 * CLARIFICATION_BATCH_SIZE + 2
+
+        clarifications = self.clarify(backend, count)
+
+        self.assertEqual(len(backend.prompts), 3)
+        batches = sorted(
+            [int(question_id) for question_id in re.findall(r"Question id (\d+)\.", prompt)]
+            for prompt in backend.prompts
+        )
+        self.assertEqual(sorted(len(batch) for batch in batches), [2, CLARIFICATION_BATCH_SIZE, CLARIFICATION_BATCH_SIZE])
+        self.assertEqual(sorted(sum(batches, [])), list(range(1, count + 1)))
+        self.assertEqual(clarifications, {number: f"Explanation {number}" for number in range(1, count + 1)})
+        self.assertEqual(self.clarify(backend, 0), {})
+
+    def test_clarifications_are_mapped_by_question_id(self):
+        backend = ClarificationBackend(skip=2)
+        with mock.patch.object(openai.ChatCompletion, "create", backend):
+            clarifications = clarify_batch(questions(3))
+
+        self.assertEqual(clarifications, {3: "Explanation 3", 1: "Explanation 1"})
+        self.assertIn("Question id 1. ", backend.prompts[0])
+        self.assertIn("The correct answer is b.", backend.prompts[0])
+
+    def test_failed_batch_is_left_out(self):
+        backend = ClarificationBackend(fail_on=1)
+        clarifications = self.clarify(backend, CLARIFICATION_BATCH_SIZE + 1)
+
+        self.assertEqual(clarifications, {CLARIFICATION_BATCH_SIZE + 1: f"Explanation {CLARIFICATION_BATCH_SIZE + 1}"})
+
+    def test_single_question_is_clarified_with_its_correct_answer(self):
+        with mock.patch.object(api, "complete_text_for_clarification", return_value="Because") as complete:
+            self.assertEqual(api.clarify_question(questions(2)[1]), "Because")
+
+        self.assertIn("Why the correct answer is a?", complete.call_args[0][0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import threading
+import time
+import unittest
+
+from utils.hedge import MIN_SAMPLES, LatencyTracker, hedged_call, percentile
+
+
+class Backend:
+    """
+    Local fake call taking a given time, then answering or failing
+    """
+
+    def __init__(self, latency: float, result: str = "answer", error: Exception = None):
+        self.latency = latency
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self) -> str:
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class HedgeTest(unittest.TestCase):
+
+    def tracker(self, latency: float) -> LatencyTracker:
+        tracker = LatencyTracker()
+        for _ in range(MIN_SAMPLES):
+            tracker.record(latency)
+        return tracker
+
+    def test_percentile_is_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([3, 1, 2], 100), 3)
+        self.assertEqual(percentile([3, 1, 2], 0), 1)
+        self.assertIsNone(LatencyTracker().percentile(50))
+
+    def test_only_successful_latencies_are_recorded(self):
+        tracker = LatencyTracker()
+        tracker.timed(Backend(0.01))()
+        with self.assertRaises(ValueError):
+            tracker.timed(Backend(0, error=ValueError("rate limited")))()
+
+        self.assertEqual(len(tracker._latencies), 1)
+
+    def test_slow_primary_is_hedged(self):
+        primary, hedge = Backend(0.5, "primary"), Backend(0.01, "hedge")
+
+        start = time.perf_counter()
+        self.assertEqual(hedged_call(primary, hedge, self.tracker(0.02), 90), "hedge")
+        self.assertLess(time.perf_counter() - start, 0.3)
+        self.assertEqual((primary.calls, hedge.calls), (1, 1))
+
+        fast = Backend(0.001, "primary")
+        self.assertEqual(hedged_call(fast, hedge, self.tracker(0.2), 90), "primary")
+        self.assertEqual(hedge.calls, 1)
+
+    def test_errors_are_not_hedged(self):
+        primary = Backend(0, error=ValueError("rate limited"))
+        hedge = Backend(0, "hedge")
+
+        with self.assertRaises(ValueError):
+            hedged_call(primary, hedge, self.tracker(0.2), 90)
+        self.assertEqual(hedge.calls, 0)
+
+        # Once hedged, the first success wins, and the error is raised only if both fail
+        slow_failure = Backend(0.1, error=ValueError("failed"))
+        self.assertEqual(hedged_call(slow_failure, Backend(0.2, "hedge"), self.tracker(0.01), 90), "hedge")
+        with self.assertRaises(ValueError):
+            hedged_call(slow_failure, Backend(0.05, error=ValueError("failed too")), self.tracker(0.01), 90)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+import json
+import threading
+import time
+import unittest
+from unittest import mock
+
+import openai
+
+from utils import api
+from utils.api import SingleFlight
+
+
+class SlowBackend:
+    """
+    Local fake of openai.ChatCompletion.create that only answers (or fails) once released
+    """
+
+    def __init__(self, error: Exception = None):
+        self.error = error
+        self.calls = 0
+        self.release = threading.Event()
+        self._lock = threading.Lock()
+
+    def __call__(self, model, messages, response_format=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+        self.release.wait(timeout=5)
+        time.sleep(0.05)
+
+        if self.error is not None:
+            raise self.error
+
+        content = json.dumps({"questions": [
+            {"question": f"Question {index + 1}?", "answers": ["A", "B", "C"], "correct_answer": "B"}
+            for index in range(3)
+        ]})
+        return {"choices": [{"message": {"content": content}}]}
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def setUp(self):
+        self.flight = SingleFlight()
+        patches = [
+            mock.patch.object(api, "generation_flight", self.flight),
+            mock.patch("builtins.print"),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def request_concurrently(self, backend: SlowBackend, topics: list) -> list:
+        """
+        Request an exam from one thread per topics, releasing the backend once all of them wait
+        :return: Outcome (list of questions or exception) of every thread, in order
+        """
+        outcomes = [None] * len(topics)
+
+        def request(index):
+            try:
+                outcomes[index] = api.get_questions(topics[index], 3, 3)
+            except Exception as e:
+                outcomes[index] = e
+
+        threads = [threading.Thread(target=request, args=(index,)) for index in range(len(topics))]
+        with mock.patch.object(openai.ChatCompletion, "create", backend):
+            for thread in threads:
+                thread.start()
+            self.wait_for(lambda: self.flight.metrics()["coalesced"] == len(topics) - 1)
+            backend.release.set()
+            for thread in threads:
+                thread.join(timeout=5)
+
+        return outcomes
+
+    @staticmethod
+    def wait_for(condition):
+        deadline = time.monotonic() + 5
+        while not condition():
+            if time.monotonic() > deadline:
+                raise AssertionError("Timed out waiting for the calls to be in flight")
+            time.sleep(0.01)
+
+    def test_identical_calls_make_one_backend_call(self):
+        backend = SlowBackend()
+        outcomes = self.request_concurrently(backend, ["Python, Algebra"] * 8)
+
+        self.assertEqual(backend.calls, 1)
+        for questions in outcomes:
+            self.assertIsInstance(questions, list)
+            self.assertEqual(questions, outcomes[0])
+        # Every caller gets its own list
+        self.assertEqual(len({id(questions) for questions in outcomes}), len(outcomes))
+
+    def test_differently_spelled_topics_coalesce(self):
+        backend = SlowBackend()
+        outcomes = self.request_concurrently(
+            backend, ["Python, Algebra", "python,algebra", "  PYTHON ,  Algebra ", "Python,,  algebra"]
+        )
+
+        self.assertEqual(backend.calls, 1)
+        self.assertTrue(all(questions == outcomes[0] for questions in outcomes))
+
+    def test_failure_reaches_every_waiter(self):
+        error = openai.error.RateLimitError("Rate limit reached")
+        backend = SlowBackend(error)
+        outcomes = self.request_concurrently(backend, ["Python"] * 5)
+
+        self.assertEqual(backend.calls, 1)
+        for outcome in outcomes:
+            self.assertIsInstance(outcome, openai.error.RateLimitError)
+        # The waiters raise their own exception chained to the one of the call
+        waiters = [outcome for outcome in outcomes if outcome is not error]
+        self.assertEqual(len(waiters), 4)
+        for outcome in waiters:
+            self.assertIs(outcome.__cause__, error)
+        self.assertEqual(len({id(outcome) for outcome in outcomes}), len(outcomes))
+
+        # A failed call is not kept in flight, the next call is executed again
+        backend.error = None
+        with mock.patch.object(openai.ChatCompletion, "create", backend):
+            self.assertEqual(len(api.get_questions("Python", 3, 3)), 3)
+        self.assertEqual(backend.calls, 2)
+
+    def test_metrics(self):
+        self.assertEqual(self.flight.metrics(), {"executed": 0, "coalesced": 0, "in_flight": 0})
+
+        release = threading.Event()
+        threads = [
+            threading.Thread(target=self.flight.do, args=(key, lambda: release.wait(timeout=5)))
+            for key in ["a", "a", "a", "b"]
+        ]
+        for thread in threads:
+            thread.start()
+        self.wait_for(lambda: self.flight.metrics()["coalesced"] == 2 and self.flight.metrics()["executed"] == 2)
+
+        self.assertEqual(self.flight.metrics(), {"executed": 2, "coalesced": 2, "in_flight": 2})
+
+        release.set()
+        for thread in threads:
+            thread.join(timeout=5)
+        self.assertEqual(self.flight.metrics(), {"executed": 2, "coalesced": 2, "in_flight": 0})
+
+        self.flight.do("a", lambda: None)
+        self.assertEqual(self.flight.metrics(), {"executed": 3, "coalesced": 2, "in_flight": 0})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import tempfile
+import time
+import unittest
+
+from utils.snapshot import SnapshotStore
+
+SESSION = "0" * 32
+
+
+class SnapshotStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.folder = temp_dir.name
+        self.store = SnapshotStore(self.folder)
+
+    def test_round_trip(self):
+        self.store.start(SESSION, "Python exam", [("python.json", 3), ("python.json", 1), ("math.json", 1)])
+        self.store.record_answer(SESSION, 0, 2)
+        self.store.record_answer(SESSION, 0, 1)
+        self.store.record_question_number(SESSION, 1)
+        self.store.record_page(SESSION, 1)
+
+        snapshot = SnapshotStore(self.folder).load(SESSION)
+
+        self.assertEqual(snapshot.exam, "Python exam")
+        self.assertFalse(snapshot.renumbered)
+        self.assertEqual(snapshot.refs, [("python.json", 3), ("python.json", 1), ("math.json", 1)])
+        self.assertEqual(snapshot.answers, {0: 1})
+        self.assertEqual((snapshot.page, snapshot.number_of_question), (1, 1))
+        self.assertIsNone(self.store.load("1" * 32))
+
+    def test_added_questions_after_a_restart(self):
+        self.store.start(SESSION, "Adaptive exam", [], renumbered=True)
+        self.store.add_question(SESSION, ("python.json", 3))
+
+        # A new store (e.g. after a restart) reads the papers of the session from its snapshot
+        store = SnapshotStore(self.folder)
+        store.add_question(SESSION, ("math.json", 2))
+        store.add_question(SESSION, ("python.json", 4))
+
+        snapshot = store.load(SESSION)
+        self.assertTrue(snapshot.renumbered)
+        self.assertEqual(snapshot.refs, [("python.json", 3), ("math.json", 2), ("python.json", 4)])
+
+        # Nothing is written for a session without snapshot
+        store.add_question("1" * 32, ("python.json", 1))
+        store.record_answer("1" * 32, 0, 0)
+        self.assertFalse(os.path.exists(store.path("1" * 32)))
+
+    def test_damaged_snapshots(self):
+        self.store.start(SESSION, "Python exam", [("python.json", 1), ("python.json", 2)])
+        self.store.record_answer(SESSION, 0, 1)
+        with open(self.store.path(SESSION), "a", encoding="utf-8") as f:
+            f.write('{"a":[1,')
+        self.assertEqual(self.store.load(SESSION).answers, {0: 1})
+
+        with open(self.store.path(SESSION), "w", encoding="utf-8") as f:
+            f.write('{"v":0,"exam":"Old exam","renumbered":false}\n')
+        self.assertIsNone(self.store.load(SESSION))
+
+    def test_delete_and_purge(self):
+        self.store.start(SESSION, "Python exam", [("python.json", 1)])
+        self.store.delete(SESSION)
+        self.assertFalse(os.path.exists(self.store.path(SESSION)))
+        self.assertEqual(self.store._papers, {})
+
+        store = SnapshotStore(self.folder, max_age=60)
+        store.start(SESSION, "Python exam", [("python.json", 1)])
+        abandoned = time.time() - 120
+        os.utime(store.path(SESSION), (abandoned, abandoned))
+
+        store._purged = None
+        store.start("1" * 32, "Math exam", [("math.json", 1)])
+
+        self.assertEqual(os.listdir(self.folder), ["1" * 32 + ".jsonl"])
+        self.assertEqual(list(store._papers), ["1" * 32])
+
+
+if __name__ == "__main__":
+    unittest.main()
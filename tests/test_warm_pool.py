@@ -0,0 +1,114 @@
+import threading
+import time
+import unittest
+
+from utils.warm_pool import WarmPool
+
+
+class Generator:
+    """
+    Local fake generator returning a distinct exam on every call
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, topics: str, number_of_questions: int, number_of_answers: int) -> list:
+        with self._lock:
+            self.calls += 1
+            return [f"{self.name} {self.calls}: {topics}"]
+
+
+class WarmPoolTest(unittest.TestCase):
+
+    def pool(self, **kwargs) -> WarmPool:
+        self.generate, self.refill = Generator("generated"), Generator("refilled")
+        pool = WarmPool(self.generate, refill=self.refill, **kwargs)
+        self.addCleanup(pool.stop)
+        return pool
+
+    @staticmethod
+    def wait_for(condition):
+        deadline = time.monotonic() + 5
+        while not condition():
+            if time.monotonic() > deadline:
+                raise AssertionError("Timed out waiting for the pool")
+            time.sleep(0.01)
+
+    def test_popular_exams_are_refilled_and_served_from_the_pool(self):
+        pool = self.pool(idle_seconds=0.05, min_requests=2, pool_size=2)
+
+        first = pool.get_questions("Python", 5, 3)
+        self.assertEqual(pool.size("python", 5, 3), 0)
+        second = pool.get_questions(" python ", 5, 3)
+        self.assertEqual(self.generate.calls, 2)
+
+        self.wait_for(lambda: pool.size("Python", 5, 3) == 2)
+        served = pool.get_questions("PYTHON", 5, 3)
+
+        self.assertEqual(self.generate.calls, 2)
+        self.assertEqual(first, ["generated 1: Python"])
+        self.assertEqual(second, ["generated 2:  python "])
+        self.assertTrue(served[0].startswith("refilled"))
+        # Exams requested once are not popular, other sizes are other exams
+        pool.get_questions("Algebra", 5, 3)
+        pool.get_questions("Python", 10, 3)
+        time.sleep(0.3)
+        self.assertEqual(pool.size("Algebra", 5, 3), 0)
+        self.assertEqual(pool.size("Python", 10, 3), 0)
+
+    def test_request_counts_decay_and_are_forgotten(self):
+        pool = self.pool(idle_seconds=60, half_life=0.2)
+        key = ("python", 5, 3)
+
+        pool.take("Python", 5, 3)
+        pool.take("Python", 5, 3)
+        self.assertEqual(pool._WarmPool__count(key), 2)
+
+        time.sleep(0.25)
+        self.assertEqual(pool._WarmPool__count(key), 1)
+
+        time.sleep(0.8)
+        with pool._lock:
+            pool._WarmPool__forget_unpopular()
+        self.assertNotIn(key, pool.requests)
+        self.assertNotIn(key, pool._topics)
+
+    def test_exam_forgotten_during_its_refill_is_not_pooled(self):
+        pool = self.pool(idle_seconds=0.05, min_requests=1)
+        key = ("python", 5, 3)
+        refilled = threading.Event()
+
+        def refill(topics, number_of_questions, number_of_answers):
+            with pool._lock:
+                del pool.requests[key]
+            refilled.set()
+            return ["exam"]
+
+        pool.refill = refill
+        pool.take("Python", 5, 3)
+        self.assertTrue(refilled.wait(timeout=5))
+        time.sleep(0.1)
+
+        self.assertNotIn(key, pool._pools)
+
+    def test_stop_ends_the_worker(self):
+        pool = self.pool(idle_seconds=0.05, min_requests=1)
+        pool.take("Python", 5, 3)
+        self.wait_for(lambda: pool.size("Python", 5, 3) == 2)
+
+        pool.stop()
+        pool._worker.join(timeout=5)
+
+        self.assertFalse(pool._worker.is_alive())
+        calls = self.refill.calls
+        pool.take("Python", 5, 3)
+        pool.take("Python", 5, 3)
+        time.sleep(0.2)
+        self.assertEqual(self.refill.calls, calls)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,279 @@
+import bisect
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from model.question import Question
+from utils.bank import PackedBank
+
+# Difficulty every item starts with before it has been attempted
+DEFAULT_DIFFICULTY = 0.0
+# Step sizes of the Elo updates for the student ability and the item difficulty
+ABILITY_K = 0.6
+DIFFICULTY_K = 0.2
+# Stop the adaptive exam once the ability is known with this standard error. An item adds at most
+# 0.25 to the Fisher information, so at least 1 / (0.25 * 0.7 ** 2) = 9 questions are asked (9 to
+# 11 in simulations), against 20-25 in a generated paper
+TARGET_STANDARD_ERROR = 0.7
+# Seconds between two scans of the question folder for papers changed outside of the app
+RESCAN_SECONDS = 60
+
+# An item is identified by the paper it is stored in and its id inside that paper
+ItemKey = Tuple[str, int]
+
+
+def probability_correct(ability: float, difficulty: float) -> float:
+    """
+    Probability of answering an item correctly (Rasch / Elo model)
+    :param ability: Ability of the student
+    :param difficulty: Difficulty of the item
+    :return: Probability of a correct answer
+    """
+    return 1.0 / (1.0 + math.exp(difficulty - ability))
+
+
+class AbilityEstimate:
+    """
+    Running estimate of the ability of a student during an adaptive exam
+    """
+
+    def __init__(self, ability: float = 0.0):
+        self.ability = ability
+        self.information = 0.0
+        self.attempts = 0
+
+    def update(self, difficulty: float, correct: bool) -> float:
+        """
+        Update the estimate with the outcome of an attempt
+        :param difficulty: Difficulty of the attempted item
+        :param correct: Whether the answer was correct
+        :return: Probability of a correct answer that was expected before the attempt
+        """
+        expected = probability_correct(self.ability, difficulty)
+        self.ability += ABILITY_K * (float(correct) - expected)
+        self.information += expected * (1.0 - expected)
+        self.attempts += 1
+        return expected
+
+    @property
+    def standard_error(self) -> float:
+        """
+        Standard error of the ability estimate (inverse square root of the Fisher information)
+        """
+        if self.information == 0:
+            return math.inf
+        return 1.0 / math.sqrt(self.information)
+
+    def is_reliable(self) -> bool:
+        return self.standard_error <= TARGET_STANDARD_ERROR
+
+
+class ItemPool:
+    """
+    Pool of all the stored questions indexed by their estimated difficulty
+
+    The difficulties are learned from past attempts and persisted to a JSON file. The index is a
+    list of (difficulty, key) pairs kept sorted, so the item closest to a given ability is found
+    with a binary search instead of scanning every question file. The question folder is only
+    scanned again when the app signals a new or edited paper (invalidate) or every RESCAN_SECONDS,
+    and only the changed papers are parsed, or read from the packed bank if it holds their current
+    version. The pool is shared by all the sessions, so every access goes through a lock.
+    """
+
+    def __init__(self, folder_path: str, stats_file: str, bank: Optional[PackedBank] = None):
+        self.folder_path = folder_path
+        self.stats_file = stats_file
+        self.bank = bank
+        self.questions: Dict[ItemKey, Question] = {}
+        self.difficulties: Dict[ItemKey, float] = {}
+        self.attempts: Dict[ItemKey, int] = {}
+        self._index: List[Tuple[float, ItemKey]] = []
+        # Modification time and size of every loaded paper, and the keys of its items
+        self._signature: Dict[str, Tuple[int, int]] = {}
+        self._paper_keys: Dict[str, List[ItemKey]] = {}
+        self._scanned = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """
+        Scan the question folder again at the next load (e.g. after a paper has been written)
+        """
+        with self._lock:
+            self._scanned = None
+
+    def load(self):
+        """
+        Load the questions and the difficulty statistics, updating the papers that have been added,
+        removed or modified (e.g. generated, or fixed in the question editor) since the last scan
+        """
+        with self._lock:
+            if self._scanned is not None and time.monotonic() - self._scanned < RESCAN_SECONDS:
+                return
+            self._scanned = time.monotonic()
+            self.__load()
+
+    def __load(self):
+        papers = self.__papers()
+        changed = [paper for paper, signature in papers.items() if self._signature.get(paper) != signature]
+        removed = [paper for paper in self._signature if paper not in papers]
+        if not changed and not removed:
+            return
+
+        questions, difficulties, attempts = dict(self.questions), dict(self.difficulties), dict(self.attempts)
+
+        for paper in removed:
+            del self._signature[paper]
+            for key in self._paper_keys.pop(paper, []):
+                del questions[key], difficulties[key], attempts[key]
+
+        stats = self.__read_stats() if changed else {}
+        for paper in changed:
+            try:
+                items = {(paper, question.id): question for question in self.__read_paper(paper, *papers[paper])}
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                # e.g. a paper being written, it is parsed again at the next scan
+                print(e)
+                continue
+
+            for key in self._paper_keys.get(paper, []):
+                if key not in items:
+                    del questions[key], difficulties[key], attempts[key]
+
+            for key, question in items.items():
+                stat = stats.get(self.__stats_key(key), {})
+                questions[key] = question
+                # The estimates learned by this process are the most recent ones
+                difficulties[key] = difficulties.get(key, stat.get("difficulty", DEFAULT_DIFFICULTY))
+                attempts[key] = attempts.get(key, stat.get("attempts", 0))
+
+            self._paper_keys[paper] = list(items)
+            self._signature[paper] = papers[paper]
+
+        self.questions, self.difficulties, self.attempts = questions, difficulties, attempts
+        self._index = sorted((difficulty, key) for key, difficulty in self.difficulties.items())
+
+    def __read_paper(self, paper: str, mtime_ns: int, size: int) -> List[Question]:
+        """
+        Read the questions of a paper, from the packed bank if it holds this version of the paper
+        """
+        if self.bank is not None:
+            ids = self.bank.ids(os.path.relpath(paper, self.folder_path), mtime_ns, size)
+            if ids is not None:
+                return [self.bank.get(bank_id) for bank_id in ids.values()]
+
+        with open(paper, "r", encoding="utf-8") as f:
+            return [
+                Question(item["id"], item["question"], item["answers"], item["correct_answer"])
+                for item in json.load(f)
+            ]
+
+    def __read_stats(self) -> Dict:
+        stats = {}
+        try:
+            with open(self.stats_file, "r", encoding="utf-8") as f:
+                stats = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, json.JSONDecodeError) as e:
+            # The statistics are only estimates, start again from the default difficulty
+            print(e)
+        return stats
+
+    def __papers(self) -> Dict[str, Tuple[int, int]]:
+        """
+        List the papers with their modification time and size
+        """
+        papers = {}
+        for root, dirs, files in os.walk(self.folder_path):
+            dirs.sort()
+            for file_name in sorted(files):
+                if file_name.endswith(".json"):
+                    paper = os.path.join(root, file_name)
+                    try:
+                        stat = os.stat(paper)
+                    except OSError:
+                        continue
+                    papers[paper] = (stat.st_mtime_ns, stat.st_size)
+        return papers
+
+    def save(self):
+        """
+        Persist the difficulty statistics of the attempted items
+        """
+        with self._lock:
+            stats = {
+                self.__stats_key(key): {"difficulty": self.difficulties[key], "attempts": attempts}
+                for key, attempts in self.attempts.items() if attempts > 0
+            }
+
+            # Replace the file at once, so a reader never sees a partially written file
+            folder = os.path.dirname(os.path.abspath(self.stats_file))
+            fd, temp_file = tempfile.mkstemp(dir=folder, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(stats, f, indent=4)
+                os.replace(temp_file, self.stats_file)
+            except BaseException:
+                os.remove(temp_file)
+                raise
+
+    def __len__(self):
+        return len(self._index)
+
+    def next_item(self, ability: float, exclude: Set[ItemKey]) -> Optional[ItemKey]:
+        """
+        Find the item whose difficulty is the closest to the ability (the most informative one)
+        :param ability: Current ability estimate
+        :param exclude: Items that must not be returned (e.g. already asked)
+        :return: Key of the item, None if there are no items left
+        """
+        with self._lock:
+            return self.__next_item(ability, exclude)
+
+    def __next_item(self, ability: float, exclude: Set[ItemKey]) -> Optional[ItemKey]:
+        position = bisect.bisect_left(self._index, (ability,))
+        left, right = position - 1, position
+
+        while left >= 0 or right < len(self._index):
+            left_distance = ability - self._index[left][0] if left >= 0 else math.inf
+            right_distance = self._index[right][0] - ability if right < len(self._index) else math.inf
+
+            if left_distance <= right_distance:
+                key = self._index[left][1]
+                left -= 1
+            else:
+                key = self._index[right][1]
+                right += 1
+
+            if key not in exclude:
+                return key
+
+        return None
+
+    def record_attempt(self, key: ItemKey, estimate: AbilityEstimate, correct: bool):
+        """
+        Record the outcome of an attempt, updating the ability and the item difficulty
+        :param key: Key of the attempted item
+        :param estimate: Ability estimate of the student
+        :param correct: Whether the answer was correct
+        """
+        with self._lock:
+            difficulty = self.difficulties[key]
+            expected = estimate.update(difficulty, correct)
+
+            self.__reindex(key, difficulty, difficulty - DIFFICULTY_K * (float(correct) - expected))
+            self.attempts[key] += 1
+
+    def __reindex(self, key: ItemKey, old_difficulty: float, new_difficulty: float):
+        position = bisect.bisect_left(self._index, (old_difficulty, key))
+        del self._index[position]
+        bisect.insort(self._index, (new_difficulty, key))
+        self.difficulties[key] = new_difficulty
+
+    def __stats_key(self, key: ItemKey) -> str:
+        paper, question_id = key
+        return f"{os.path.relpath(paper, self.folder_path)}#{question_id}"
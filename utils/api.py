@@ -1,12 +1,97 @@
-from typing import List
+import copy
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, List, TypeVar
 
 import openai
 import re, json
 
 from model.question import Question
+from utils.hedge import LatencyTracker, hedged_call
 
 MODEL = "gpt-3.5-turbo"
 
+# Hedged requests (opt-in): if the first request has not answered within HEDGE_PERCENTILE of the
+# observed latency, a duplicate is sent to HEDGE_FALLBACK_MODEL (or MODEL if not set)
+HEDGE_ENABLED = False
+HEDGE_PERCENTILE = 90
+HEDGE_FALLBACK_MODEL = None
+
+# Maximum number of questions clarified by a single request of clarify_questions
+CLARIFICATION_BATCH_SIZE = 6
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical calls: while a call with a given key is in flight, other calls
+    with the same key wait for it and share its result instead of calling again. If it fails,
+    every waiter raises its own copy of the error, chained to the original one.
+    """
+
+    class Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, "SingleFlight.Call"] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, function: Callable[[], T]) -> T:
+        """
+        Call function, unless a call with the same key is already in flight
+        :param key: Key identifying identical calls
+        :param function: Function to call
+        :return: Result of the call
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = SingleFlight.Call()
+                self.executed += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                # Raising the shared instance would pile the tracebacks of all the waiters onto it
+                try:
+                    error = copy.copy(call.error)
+                except Exception:
+                    error = RuntimeError(f"Coalesced call failed: {call.error!r}")
+                raise error from call.error
+            return call.result
+
+        try:
+            call.result = function()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result
+
+    def metrics(self) -> Dict[str, int]:
+        """
+        Number of calls executed, and number of calls coalesced into a call already in flight
+        """
+        with self._lock:
+            return {"executed": self.executed, "coalesced": self.coalesced, "in_flight": len(self._calls)}
+
+
+latency_tracker = LatencyTracker()
+generation_flight = SingleFlight()
+
 
 def complete_text(prompt: str) -> str:
     """
@@ -30,14 +115,24 @@ def complete_text(prompt: str) -> str:
          ]
     }
 
-    chat_completion = openai.ChatCompletion.create(
-        model=MODEL,
-        response_format={"type":"json_object"},
-        messages=[
-            {"role":"system","content":"Provide output in valid JSON. The data schema should be like this: "+json.dumps(example_json)},
-            {"role":"user","content":prompt}
-        ]
-    )
+    messages = [
+        {"role":"system","content":"Provide output in valid JSON. The data schema should be like this: "+json.dumps(example_json)},
+        {"role":"user","content":prompt}
+    ]
+
+    def create(model):
+        return lambda: openai.ChatCompletion.create(
+            model=model,
+            response_format={"type":"json_object"},
+            messages=messages
+        )
+
+    if HEDGE_ENABLED:
+        chat_completion = hedged_call(
+            create(MODEL), create(HEDGE_FALLBACK_MODEL or MODEL), latency_tracker, HEDGE_PERCENTILE
+        )
+    else:
+        chat_completion = latency_tracker.timed(create(MODEL))()
 
     return chat_completion["choices"][0]["message"]["content"]
 
@@ -45,6 +140,16 @@ def complete_text(prompt: str) -> str:
     #return openai.ChatCompletion.create(model=MODEL, messages=messages)["choices"][0]["message"]["content"]
 
 
+def normalize_topics(topics: str) -> str:
+    """
+    Normalize the topics so that equivalent requests can be recognized
+    :param topics: Topics to include in the exam
+    :return: Lowercase, comma-separated topics without duplicated whitespace
+    """
+    parts = [" ".join(topic.lower().split()) for topic in topics.split(",")]
+    return ", ".join(part for part in parts if part)
+
+
 def prepare_prompt(topics: str, number_of_questions: int, number_of_answers: int) -> str:
     """
     Prepare prompt to complete
@@ -150,7 +255,23 @@ def response_to_questions(response: str) -> List[Question]:
 
 def get_questions(topics: str, number_of_questions: int, number_of_answers: int) -> List[Question]:
     """
-    Get questions from OpenAI API
+    Get questions from OpenAI API, sharing a single call between concurrent identical requests
+    :param topics: Topics to include in the exam
+    :param number_of_questions: Number of questions
+    :param number_of_answers: Number of answers
+    :return: List of questions
+    """
+    key = (normalize_topics(topics), int(number_of_questions), int(number_of_answers), MODEL)
+
+    # Every caller gets its own list, the questions themselves are not modified
+    return list(generation_flight.do(
+        key, lambda: request_questions(topics, number_of_questions, number_of_answers)
+    ))
+
+
+def request_questions(topics: str, number_of_questions: int, number_of_answers: int) -> List[Question]:
+    """
+    Request questions from OpenAI API
     :param topics: Topics to include in the exam
     :param number_of_questions: Number of questions
     :param number_of_answers: Number of answers
@@ -180,17 +301,93 @@ def complete_text_for_clarification(prompt: str) -> str:
 
 
 
+def complete_text_for_batch_clarification(prompt: str) -> str:
+    """
+    Complete text using GPT-3.5 Turbo, answering with the clarifications of several questions in JSON
+    :param prompt: Prompt to complete
+    :return: Completed text
+    """
+    example_json = {
+        "clarifications": [
+            {
+                "id": 1,
+                "explanation": "The sine of 90 degrees is 1 because..."
+            }
+        ]
+    }
+
+    messages = [
+        {"role":"system","content":"Provide output in valid JSON. The data schema should be like this: "+json.dumps(example_json)},
+        {"role":"user","content":prompt}
+    ]
+
+    return openai.ChatCompletion.create(
+        model=MODEL,
+        response_format={"type":"json_object"},
+        messages=messages
+    )["choices"][0]["message"]["content"]
+
+
+def describe_question(question: Question) -> str:
+    """
+    Describe a question and its answers for a clarification prompt
+    :param question: Question to describe
+    :return: Description of the question
+    """
+    join_questions = "\n".join([f"{chr(ord('a') + i)}. {answer}" for i, answer in enumerate(question.answers)])
+
+    return f"Given this question: {question.question}\n and these answers: {join_questions}\n\n"
+
+
 def clarify_question(question: Question) -> str:
     """
     Clarify a question using GPT-3.5 Turbo
     :param question: Question to clarify
     :return: Text clarifying the question
     """
-    join_questions = "\n".join([f"{chr(ord('a') + i)}. {answer}" for i, answer in enumerate(question.answers)])
-
-    prompt = f"Given this question: {question.question}\n"
-    prompt += f" and these answers: {join_questions}\n\n"
+    prompt = describe_question(question)
     prompt += f"Why the correct answer is {chr(ord('a') + question.correct_answer)}?\n\n"
 
     #print(prompt)
     return complete_text_for_clarification(prompt)
+
+
+def clarify_batch(questions: List[Question]) -> Dict[int, str]:
+    """
+    Clarify several questions with a single request
+    :param questions: Questions to clarify
+    :return: Dictionary with the clarification of every question by question id
+    """
+    prompt = "Explain why the correct answer of each of the following questions is correct.\n\n"
+    for question in questions:
+        prompt += f"Question id {question.id}. " + describe_question(question)
+        prompt += f"The correct answer is {chr(ord('a') + question.correct_answer)}.\n\n"
+
+    data = json.loads(complete_text_for_batch_clarification(prompt))
+
+    return {int(item["id"]): item["explanation"] for item in data["clarifications"]}
+
+
+def clarify_questions(questions: List[Question]) -> Dict[int, str]:
+    """
+    Clarify several questions, sending concurrent requests of up to CLARIFICATION_BATCH_SIZE questions
+    :param questions: Questions to clarify
+    :return: Dictionary with the clarification of every question by question id (the questions
+        missing from a response, or whose request failed, are left out)
+    """
+    batches = [
+        questions[index:index + CLARIFICATION_BATCH_SIZE]
+        for index in range(0, len(questions), CLARIFICATION_BATCH_SIZE)
+    ]
+    if not batches:
+        return {}
+
+    clarifications = {}
+    with ThreadPoolExecutor(max_workers=len(batches)) as executor:
+        for future in [executor.submit(clarify_batch, batch) for batch in batches]:
+            try:
+                clarifications.update(future.result())
+            except Exception as e:
+                print(e)
+
+    return clarifications
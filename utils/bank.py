@@ -0,0 +1,291 @@
+import json
+import mmap
+import os
+import random
+import struct
+import sys
+from typing import Dict, Iterable, List, Optional
+
+from model.question import Question
+
+INDEX_FILE = "index.bin"
+# Modification time, size and bank ids of the questions of every packed paper
+PAPERS_FILE = "papers.json"
+SEGMENT_FILE = "segment-{:05d}.dat"
+MAGIC = b"QPB1"
+HEADER = struct.Struct("<4sI")
+# Every index entry is (segment number, offset, length), so the entry of a question is found at
+# a fixed position computed from its id
+ENTRY = struct.Struct("<IQI")
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024
+
+
+class BankWriter:
+    """
+    Writer of a packed question bank
+
+    The bank is a folder with one or more segment files, holding the questions as compact JSON
+    records one after the other, an index file with the position of every question, and a file
+    mapping every packed paper to the bank ids of its questions. The index is written last, so a
+    bank whose writing failed cannot be opened.
+    """
+
+    def __init__(self, path: str, segment_size: int = DEFAULT_SEGMENT_SIZE):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.segment_size = segment_size
+        # Files of a previous bank are removed, not overwritten, so that a running app which has
+        # them memory-mapped keeps reading them
+        for file_name in os.listdir(path):
+            if file_name in (INDEX_FILE, PAPERS_FILE) or file_name.startswith("segment-"):
+                os.remove(os.path.join(path, file_name))
+
+        self._papers: Dict[str, Dict] = {}
+        self._entries = bytearray()
+        self._count = 0
+        self._segment_number = -1
+        self._segment = None
+        self._offset = 0
+
+    def add(self, record: Dict) -> int:
+        """
+        Add a question to the bank
+        :param record: Question as a dictionary (id, question, answers, correct_answer, paper)
+        :return: Id of the question in the bank
+        """
+        if "paper" in record:
+            paper = self._papers.setdefault(record["paper"], {"mtime_ns": None, "size": None, "ids": []})
+            paper["ids"].append([record["id"], self._count])
+
+        data = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+        if self._segment is None or (self._offset and self._offset + len(data) > self.segment_size):
+            self.__next_segment()
+
+        self._segment.write(data)
+        self._entries += ENTRY.pack(self._segment_number, self._offset, len(data) - 1)
+        self._offset += len(data)
+        self._count += 1
+        return self._count - 1
+
+    def add_paper(self, paper: str, mtime_ns: int, size: int):
+        """
+        Record the version of a packed paper, so that readers can tell whether it changed since
+        :param paper: Path of the paper relative to the question folder
+        :param mtime_ns: Modification time of the paper in nanoseconds
+        :param size: Size of the paper in bytes
+        """
+        self._papers.setdefault(paper, {"ids": []}).update(mtime_ns=mtime_ns, size=size)
+
+    def close(self):
+        """
+        Close the current segment and write the index
+        """
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+
+        with open(os.path.join(self.path, PAPERS_FILE), "w", encoding="utf-8") as f:
+            json.dump(self._papers, f, ensure_ascii=False, separators=(",", ":"))
+
+        with open(os.path.join(self.path, INDEX_FILE), "wb") as f:
+            f.write(HEADER.pack(MAGIC, self._count))
+            f.write(self._entries)
+
+    def __next_segment(self):
+        if self._segment is not None:
+            self._segment.close()
+        self._segment_number += 1
+        self._segment = open(os.path.join(self.path, SEGMENT_FILE.format(self._segment_number)), "wb")
+        self._offset = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        elif self._segment is not None:
+            # No index: the partially written bank must not look valid
+            self._segment.close()
+            self._segment = None
+
+
+class PackedBank:
+    """
+    Read-only access to a packed question bank
+
+    The index and the segments are memory-mapped, and a question is only decoded when it is
+    accessed, so any question is read in constant time without parsing the rest of the bank.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, INDEX_FILE), "rb") as f:
+            self._index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self._count = HEADER.unpack_from(self._index, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a packed question bank")
+
+        self._segments: Dict[int, mmap.mmap] = {}
+
+        self._papers: Dict[str, Dict] = {}
+        if os.path.isfile(os.path.join(path, PAPERS_FILE)):
+            with open(os.path.join(path, PAPERS_FILE), "r", encoding="utf-8") as f:
+                self._papers = json.load(f)
+
+    def __len__(self):
+        return self._count
+
+    def record(self, bank_id: int) -> Dict:
+        """
+        Get the raw record of a question
+        :param bank_id: Id of the question in the bank
+        :return: Question as a dictionary
+        """
+        if not 0 <= bank_id < self._count:
+            raise IndexError(f"Question {bank_id} is not in the bank")
+
+        segment_number, offset, length = ENTRY.unpack_from(self._index, HEADER.size + bank_id * ENTRY.size)
+        segment = self.__segment(segment_number)
+        return json.loads(segment[offset:offset + length])
+
+    def get(self, bank_id: int) -> Question:
+        """
+        Get a question
+        :param bank_id: Id of the question in the bank
+        :return: Question (with its id in the original paper)
+        """
+        record = self.record(bank_id)
+        return Question(record["id"], record["question"], record["answers"], record["correct_answer"])
+
+    def ids(self, paper: str, mtime_ns: int, size: int) -> Optional[Dict[int, int]]:
+        """
+        Get the bank ids of the questions of a paper
+        :param paper: Path of the paper relative to the question folder
+        :param mtime_ns: Current modification time of the paper in nanoseconds
+        :param size: Current size of the paper in bytes
+        :return: Bank id by question id, None if the paper is not in the bank or has changed since
+        """
+        packed = self._papers.get(paper)
+        if packed is None or (packed["mtime_ns"], packed["size"]) != (mtime_ns, size):
+            return None
+        return {question_id: bank_id for question_id, bank_id in packed["ids"]}
+
+    def sample(self, k: int, rng: Optional[random.Random] = None) -> List[Question]:
+        """
+        Get a random sample of questions, decoding only the sampled ones
+        :param k: Number of questions
+        :param rng: Random number generator
+        :return: List of questions
+        """
+        rng = rng or random
+        return [self.get(bank_id) for bank_id in rng.sample(range(self._count), min(k, self._count))]
+
+    def close(self):
+        for segment in self._segments.values():
+            segment.close()
+        self._segments = {}
+        self._index.close()
+
+    def __segment(self, segment_number: int) -> mmap.mmap:
+        if segment_number not in self._segments:
+            with open(os.path.join(self.path, SEGMENT_FILE.format(segment_number)), "rb") as f:
+                self._segments[segment_number] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._segments[segment_number]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def open_bank(path: str) -> Optional[PackedBank]:
+    """
+    Open the packed bank of a folder if there is one
+    :param path: Folder of the packed bank
+    :return: Packed bank, None if the folder does not hold a valid bank
+    """
+    if not os.path.isfile(os.path.join(path, INDEX_FILE)):
+        return None
+
+    try:
+        return PackedBank(path)
+    except (OSError, ValueError, struct.error) as e:
+        print(e)
+        return None
+
+
+def pack_folder(folder_path: str, path: str, segment_size: int = DEFAULT_SEGMENT_SIZE) -> int:
+    """
+    Convert the JSON question papers of a folder (and its subfolders) to a packed bank
+    :param folder_path: Folder with the question papers
+    :param path: Folder of the packed bank
+    :param segment_size: Maximum size of a segment file in bytes
+    :return: Number of questions in the bank
+    """
+    count = 0
+    with BankWriter(path, segment_size) as writer:
+        for root, dirs, files in os.walk(folder_path):
+            dirs.sort()
+            for file_name in sorted(files):
+                if not file_name.endswith(".json"):
+                    continue
+                paper = os.path.join(root, file_name)
+                stat = os.stat(paper)
+                with open(paper, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+
+                writer.add_paper(os.path.relpath(paper, folder_path), stat.st_mtime_ns, stat.st_size)
+                for item in data:
+                    writer.add({
+                        "id": item["id"],
+                        "question": item["question"],
+                        "answers": item["answers"],
+                        "correct_answer": item["correct_answer"],
+                        "paper": os.path.relpath(paper, folder_path),
+                    })
+                    count += 1
+
+    return count
+
+
+def export_json(bank: PackedBank, output_file: str, bank_ids: Optional[Iterable[int]] = None):
+    """
+    Export questions of a packed bank as a JSON question paper (same format as the Questions folder)
+    :param bank: Packed bank
+    :param output_file: Output file
+    :param bank_ids: Ids of the questions to export (all of them if not given)
+    """
+    if bank_ids is None:
+        bank_ids = range(len(bank))
+
+    with open(output_file, "w", encoding="utf-8") as f:
+        f.write("[")
+        for number, bank_id in enumerate(bank_ids):
+            question = bank.get(bank_id)
+            question_json = json.dumps({
+                "id": number + 1,
+                "question": question.question,
+                "answers": question.answers,
+                "correct_answer": question.correct_answer,
+            }, indent=4)
+            f.write(("," if number else "") + "\n    " + question_json.replace("\n", "\n    "))
+        f.write("\n]")
+
+
+if __name__ == "__main__":
+    usage = "Usage: python -m utils.bank pack <questions folder> <bank folder> | export <bank folder> <output file>"
+
+    if len(sys.argv) != 4 or sys.argv[1] not in ("pack", "export"):
+        print(usage)
+        sys.exit(1)
+
+    if sys.argv[1] == "pack":
+        print(f"Packed {pack_folder(sys.argv[2], sys.argv[3])} questions into {sys.argv[3]}")
+    else:
+        with PackedBank(sys.argv[2]) as packed_bank:
+            export_json(packed_bank, sys.argv[3])
+        print(f"Exported {len(packed_bank)} questions to {sys.argv[3]}")
@@ -0,0 +1,206 @@
+import html
+import os
+import time
+from typing import Callable, Dict, Iterable, Iterator, TextIO
+from xml.sax.saxutils import escape, quoteattr
+
+from model.question import Question
+
+
+def answer_label(index: int) -> str:
+    """
+    Label of an answer (a, b, c...)
+    :param index: Index of the answer
+    :return: Label of the answer
+    """
+    return chr(ord('a') + index)
+
+
+def iter_markdown(questions: Iterable[Question]) -> Iterator[str]:
+    """
+    Export questions to Markdown
+    :param questions: Questions to export
+    :return: Chunks of the Markdown document
+    """
+    for index, question in enumerate(questions):
+        yield f"**{index + 1}. {question.question}**\n\n"
+
+        for answer in question.answers:
+            yield f"- [ ] {answer}\n"
+
+        yield "\n"
+
+
+def iter_html(questions: Iterable[Question]) -> Iterator[str]:
+    """
+    Export questions to an HTML handout
+    :param questions: Questions to export
+    :return: Chunks of the HTML document
+    """
+    yield '<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n<title>Exam</title>\n</head>\n<body>\n<ol>\n'
+
+    for question in questions:
+        yield f"<li>\n<p><strong>{html.escape(question.question)}</strong></p>\n<ol type=\"a\">\n"
+
+        for answer in question.answers:
+            yield f"<li>{html.escape(answer)}</li>\n"
+
+        yield "</ol>\n</li>\n"
+
+    yield "</ol>\n</body>\n</html>\n"
+
+
+def iter_answer_key(questions: Iterable[Question]) -> Iterator[str]:
+    """
+    Export the answer key sheet of the questions
+    :param questions: Questions to export
+    :return: Chunks of the answer key (Markdown)
+    """
+    yield "# Answer key\n\n"
+
+    for index, question in enumerate(questions):
+        correct = question.correct_answer
+        yield f"{index + 1}. {answer_label(correct)}) {question.answers[correct]}\n"
+
+
+def gift_escape(text: str) -> str:
+    """
+    Escape the characters with a special meaning in Moodle GIFT
+    """
+    for char in "\\~=#{}:":
+        text = text.replace(char, "\\" + char)
+    return text.replace("\n", "\\n")
+
+
+def iter_gift(questions: Iterable[Question]) -> Iterator[str]:
+    """
+    Export questions to Moodle GIFT
+    :param questions: Questions to export
+    :return: Chunks of the GIFT document
+    """
+    for index, question in enumerate(questions):
+        yield f"::Q{index + 1}:: {gift_escape(question.question)} {{\n"
+
+        for answer_index, answer in enumerate(question.answers):
+            prefix = "=" if answer_index == question.correct_answer else "~"
+            yield f"\t{prefix}{gift_escape(answer)}\n"
+
+        yield "}\n\n"
+
+
+def iter_qti(questions: Iterable[Question]) -> Iterator[str]:
+    """
+    Export questions to IMS QTI 1.2
+    :param questions: Questions to export
+    :return: Chunks of the QTI XML document
+    """
+    yield (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<questestinterop>\n'
+        '<assessment ident="exam" title="Exam">\n'
+        '<section ident="root_section">\n'
+    )
+
+    for index, question in enumerate(questions):
+        ident = f"q{index + 1}"
+        yield (
+            f'<item ident={quoteattr(ident)} title={quoteattr(f"Question {index + 1}")}>\n'
+            f'<presentation>\n'
+            f'<material><mattext texttype="text/plain">{escape(question.question)}</mattext></material>\n'
+            f'<response_lid ident="response_{ident}" rcardinality="Single">\n'
+            f'<render_choice>\n'
+        )
+
+        for answer_index, answer in enumerate(question.answers):
+            yield (
+                f'<response_label ident="{answer_label(answer_index)}">'
+                f'<material><mattext texttype="text/plain">{escape(answer)}</mattext></material>'
+                f'</response_label>\n'
+            )
+
+        yield (
+            f'</render_choice>\n'
+            f'</response_lid>\n'
+            f'</presentation>\n'
+            f'<resprocessing>\n'
+            f'<outcomes><decvar maxvalue="100" minvalue="0" varname="SCORE" vartype="Decimal"/></outcomes>\n'
+            f'<respcondition continue="No">\n'
+            f'<conditionvar><varequal respident="response_{ident}">{answer_label(question.correct_answer)}</varequal></conditionvar>\n'
+            f'<setvar action="Set" varname="SCORE">100</setvar>\n'
+            f'</respcondition>\n'
+            f'</resprocessing>\n'
+            f'</item>\n'
+        )
+
+    yield '</section>\n</assessment>\n</questestinterop>\n'
+
+
+class ExportFormat:
+    """
+    Export format: chunk generator, file extension and MIME type
+    """
+
+    def __init__(self, generator: Callable[[Iterable[Question]], Iterator[str]], extension: str, mime: str):
+        self.generator = generator
+        self.extension = extension
+        self.mime = mime
+
+
+EXPORT_FORMATS: Dict[str, ExportFormat] = {
+    "Markdown": ExportFormat(iter_markdown, "md", "text/markdown"),
+    "HTML": ExportFormat(iter_html, "html", "text/html"),
+    "Answer key": ExportFormat(iter_answer_key, "md", "text/markdown"),
+    "Moodle GIFT": ExportFormat(iter_gift, "txt", "text/plain"),
+    "QTI 1.2": ExportFormat(iter_qti, "xml", "application/xml"),
+}
+
+
+def write_export(questions: Iterable[Question], export_format: str, stream: TextIO) -> int:
+    """
+    Export questions to a stream, chunk by chunk, without building the whole document in memory
+    :param questions: Questions to export (can be a lazy iterable)
+    :param export_format: Name of the format (key of EXPORT_FORMATS)
+    :param stream: Text stream to write to
+    :return: Number of characters written
+    """
+    written = 0
+    write = stream.write
+
+    for chunk in EXPORT_FORMATS[export_format].generator(questions):
+        written += write(chunk)
+
+    return written
+
+
+def benchmark(number_of_questions: int = 100_000) -> Dict[str, Dict[str, float]]:
+    """
+    Measure the export throughput of every format on a synthetic bank, writing to os.devnull
+    :param number_of_questions: Number of questions in the bank
+    :return: Dictionary with the questions per second and MB per second of every format
+    """
+    def bank():
+        for index in range(number_of_questions):
+            yield Question(
+                index + 1,
+                f"What is the value of {index} + {index} (question with <special> & {{chars}})?",
+                [str(index * 2), str(index * 2 + 1), str(index), "None of the above"],
+                0,
+            )
+
+    results = {}
+    with open(os.devnull, "w", encoding="utf-8") as stream:
+        for export_format in EXPORT_FORMATS:
+            start = time.perf_counter()
+            written = write_export(bank(), export_format, stream)
+            elapsed = time.perf_counter() - start
+            results[export_format] = {
+                "questions_per_second": number_of_questions / elapsed,
+                "mb_per_second": written / elapsed / 1_000_000,
+            }
+
+    return results
+
+
+if __name__ == "__main__":
+    for name, result in benchmark().items():
+        print(f"{name:<12} {result['questions_per_second']:>12,.0f} questions/s {result['mb_per_second']:>8.1f} MB/s")
@@ -3,6 +3,7 @@ import subprocess
 from typing import List
 
 from model.question import Question
+from utils.export import iter_markdown, write_export
 
 TEMP_MD_FILE = "__temp.md"
 TEMP_PDF_FILE = "__temp.pdf"
@@ -14,17 +15,7 @@ def questions_to_markdown(questions: List[Question]) -> str:
     :param questions: List of questions
     :return: Markdown string
     """
-    markdown = ""
-
-    for index, question in enumerate(questions):
-        markdown += f"**{index + 1}. {question.question}**\n\n"
-
-        for answer in question.answers:
-            markdown += f"- [ ] {answer}\n"
-
-        markdown += "\n"
-
-    return markdown
+    return "".join(iter_markdown(questions))
 
 
 def markdown_to_pdf(markdown: str, output_file: str):
@@ -37,14 +28,23 @@ def markdown_to_pdf(markdown: str, output_file: str):
         f.write(markdown)
 
     #print(markdown)
+    markdown_file_to_pdf(TEMP_MD_FILE, output_file)
+
+
+def markdown_file_to_pdf(markdown_file: str, output_file: str):
+    """
+    Convert a Markdown file to PDF and remove the Markdown file
+    :param markdown_file: Markdown file
+    :param output_file: Output file
+    """
     subprocess.run([
-        "mdpdf", TEMP_MD_FILE,
+        "mdpdf", markdown_file,
         "--output", output_file,
         "--footer", ",,{page}",
         "--paper", "A4"
     ])
 
-    os.remove(TEMP_MD_FILE)
+    os.remove(markdown_file)
 
 
 def questions_to_pdf(questions: List[Question], output_file: str):
@@ -53,5 +53,7 @@ def questions_to_pdf(questions: List[Question], output_file: str):
     :param questions: List of questions
     :param output_file: Output file
     """
-    markdown = questions_to_markdown(questions)
-    markdown_to_pdf(markdown, output_file)
+    with open(TEMP_MD_FILE, "w", encoding="utf-8") as f:
+        write_export(questions, "Markdown", f)
+
+    markdown_file_to_pdf(TEMP_MD_FILE, output_file)
@@ -0,0 +1,177 @@
+import math
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Delay before hedging while there are not enough latency samples to compute a percentile
+DEFAULT_HEDGE_DELAY = 10.0
+MIN_SAMPLES = 20
+
+
+def percentile(values: List[float], p: float) -> float:
+    """
+    Compute a percentile using the nearest-rank method
+    :param values: Values to compute the percentile of
+    :param p: Percentile (0-100)
+    :return: Value of the percentile
+    """
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class LatencyTracker:
+    """
+    Sliding window of the latencies observed for a backend
+    """
+
+    def __init__(self, window: int = 200):
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """
+        Percentile of the observed latencies
+        :param p: Percentile (0-100)
+        :return: Latency in seconds, None if there are not enough samples yet
+        """
+        with self._lock:
+            latencies = list(self._latencies)
+
+        if len(latencies) < MIN_SAMPLES:
+            return None
+
+        return percentile(latencies, p)
+
+    def timed(self, call: Callable[[], T]) -> Callable[[], T]:
+        """
+        Wrap a call so that its latency is recorded when it succeeds (fast failures, e.g. when
+        rate limited, would pull the percentiles down)
+        """
+        def wrapper():
+            start = time.perf_counter()
+            result = call()
+            self.record(time.perf_counter() - start)
+            return result
+
+        return wrapper
+
+
+def hedged_call(primary: Callable[[], T], hedge: Callable[[], T], tracker: LatencyTracker, hedge_percentile: float) -> T:
+    """
+    Call primary and, if it has not answered within the given percentile of the observed latency,
+    fire hedge as well. The first successful answer is returned. A failure of primary before the
+    hedge is fired is raised as is: hedging on errors (e.g. rate limiting) would only double the
+    load on a backend that is already refusing requests.
+
+    The losing call is cancelled if it has not started yet; a request that is already on the wire
+    cannot be interrupted, so it is left to finish in the background and its result is discarded.
+    :param primary: Primary call
+    :param hedge: Duplicate call (e.g. the same request to a fallback model)
+    :param tracker: Tracker of the observed latencies, updated with every attempt
+    :param hedge_percentile: Percentile (0-100) of the observed latency after which to hedge
+    :return: Result of the first call that answered successfully
+    """
+    delay = tracker.percentile(hedge_percentile)
+    if delay is None:
+        delay = DEFAULT_HEDGE_DELAY
+
+    executor = ThreadPoolExecutor(max_workers=2)
+    try:
+        pending = {executor.submit(tracker.timed(primary))}
+        done, _ = wait(pending, timeout=delay)
+
+        if done:
+            return next(iter(done)).result()
+
+        pending.add(executor.submit(tracker.timed(hedge)))
+
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+
+        raise error
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+class FakeBackend:
+    """
+    Local fake backend with injected latency: most calls take around base_latency seconds, but a
+    fraction of them (tail_probability) is tail_factor times slower
+    """
+
+    def __init__(self, base_latency: float = 0.02, tail_probability: float = 0.05, tail_factor: float = 20.0, seed: int = 0):
+        self.base_latency = base_latency
+        self.tail_probability = tail_probability
+        self.tail_factor = tail_factor
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __call__(self) -> str:
+        with self._lock:
+            latency = self.base_latency * self._random.lognormvariate(0, 0.25)
+            if self._random.random() < self.tail_probability:
+                latency *= self.tail_factor
+
+        time.sleep(latency)
+        return "{}"
+
+
+def benchmark(backend: Callable[[], str], requests: int, hedging: bool, hedge_percentile: float = 95) -> Dict[str, float]:
+    """
+    Measure the latency percentiles seen by the caller for a number of sequential requests
+    :param backend: Backend to call
+    :param requests: Number of requests
+    :param hedging: Whether to use hedged requests
+    :param hedge_percentile: Percentile of the observed latency after which to hedge
+    :return: Dictionary with the p50, p95 and p99 latencies in seconds, and the extra backend calls
+        made by hedging as a fraction of the requests
+    """
+    tracker = LatencyTracker()
+    latencies = []
+    calls = 0
+    lock = threading.Lock()
+
+    def counted():
+        nonlocal calls
+        with lock:
+            calls += 1
+        return backend()
+
+    for _ in range(requests):
+        start = time.perf_counter()
+        if hedging:
+            hedged_call(counted, counted, tracker, hedge_percentile)
+        else:
+            tracker.timed(counted)()
+        latencies.append(time.perf_counter() - start)
+
+    result = {f"p{p}": percentile(latencies, p) for p in (50, 95, 99)}
+    result["extra_calls"] = calls / requests - 1
+    return result
+
+
+if __name__ == "__main__":
+    # The hedge only pays off if it fires before the tail of the backend (5% of the calls here), so
+    # the percentile is swept to show the latency gained against the extra calls made
+    for hedging, hedge_percentile in ((False, None), (True, 80), (True, 90), (True, 95)):
+        result = benchmark(FakeBackend(), requests=500, hedging=hedging, hedge_percentile=hedge_percentile)
+        print(
+            (f"hedging=p{hedge_percentile} " if hedging else "hedging=off ")
+            + " ".join(f"{name}={result[name] * 1000:.1f}ms" for name in ("p50", "p95", "p99"))
+            + f" extra_calls={result['extra_calls']:.0%}"
+        )
@@ -0,0 +1,377 @@
+"""
+Load-testing harness for the Streamlit app
+
+Drives many simulated sessions through the full flow (generate or browse, answer the questions,
+view the results, clarify a question) with Streamlit's testing harness, against a local fake
+OpenAI backend, and reports the throughput, the per-page render p50/p99 and the memory per
+session for every concurrency level of the ramp.
+
+    python -m utils.loadtest --ramp 1,2,4,8 --save-baseline loadtest_baseline.json
+    python -m utils.loadtest --ramp 1,2,4,8 --baseline loadtest_baseline.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+from unittest.mock import MagicMock
+
+import openai
+import streamlit as st
+
+from utils.hedge import percentile
+
+# share_runtime patches internals of Streamlit's testing harness, checked against this version
+CHECKED_STREAMLIT_VERSION = "1.66.0"
+INTERNALS_ERROR = (
+    "The load test relies on internals of Streamlit's testing harness that are missing in Streamlit "
+    f"{st.__version__} ({{}}); it was checked against Streamlit {CHECKED_STREAMLIT_VERSION}"
+)
+
+try:
+    import streamlit.testing.v1.app_test as app_test
+    import streamlit.testing.v1.local_script_runner as local_script_runner
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.runtime.secrets import Secrets
+    from streamlit.testing.v1 import AppTest
+    from streamlit.testing.v1.util import patch_config_options
+except ImportError as e:
+    raise SystemExit(INTERNALS_ERROR.format(e))
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, "GPT-QuestPro.py")
+# Patches kept active for the whole load test
+SHARED_PATCHES = contextlib.ExitStack()
+
+
+class FakeOpenAI:
+    """
+    Local fake of openai.ChatCompletion.create with injected latency
+    """
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    def __call__(self, model, messages, response_format=None, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        prompt = messages[-1]["content"]
+
+        if response_format is None:
+            content = "The correct answer follows from the definitions used in the question."
+        elif "clarifications" in messages[0]["content"]:
+            content = json.dumps({"clarifications": [
+                {"id": int(question_id), "explanation": "The correct answer follows from the definitions."}
+                for question_id in re.findall(r"Question id (\d+)\.", prompt)
+            ]})
+        else:
+            match = re.search(r"with (\d+) questions and (\d+) of possible answers", prompt)
+            number_of_questions, number_of_answers = (int(group) for group in match.groups()) if match else (10, 4)
+            content = json.dumps({"questions": [
+                {
+                    "question": f"Fake question {index + 1}?",
+                    "answers": [f"Answer {answer}" for answer in range(number_of_answers)],
+                    "correct_answer": f"Answer {index % number_of_answers}",
+                }
+                for index in range(number_of_questions)
+            ]})
+
+        return {"choices": [{"message": {"content": content}}]}
+
+
+def fake_questions_to_pdf(questions, output_file: str):
+    """
+    Stand-in for questions_to_pdf when mdpdf is not installed
+    """
+    with open(output_file, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+
+
+def share_runtime():
+    """
+    Make AppTest usable from several threads at once
+
+    Every AppTest run installs its own mock Runtime and secrets globally and removes them when it
+    finishes, which breaks the runs still in progress. Here all the sessions share one mock Runtime
+    (and so one cache, like the sessions of a real server), the same secrets, the same compiled
+    script and the same config.
+    """
+    missing = [
+        f"{owner.__name__}.{name}" for owner, name in (
+            (Runtime, "_instance"), (app_test, "Runtime"), (app_test, "ScriptCache"),
+            (app_test, "patch_config_options"), (local_script_runner, "ScriptCache"),
+        ) if not hasattr(owner, name)
+    ]
+    if missing:
+        raise SystemExit(INTERNALS_ERROR.format(", ".join(missing)))
+
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime._instance = runtime
+    # AppTest sets and clears the instance of this subclass instead of the real one
+    app_test.Runtime = type("Runtime", (Runtime,), {})
+
+    # Compile the script once: every run compiles it again otherwise, and parallel ast.parse calls
+    # are not thread-safe
+    script_cache = ScriptCache()
+    script_cache.get_bytecode(SCRIPT)
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: script_cache
+
+    # Every run patches the config for its duration, and overlapping patches restore each other
+    SHARED_PATCHES.enter_context(patch_config_options({"global.appTest": True}))
+    app_test.patch_config_options = lambda config_overrides: contextlib.nullcontext()
+
+    secrets = Secrets()
+    secrets._secrets = {"OPENAI_TOKEN": "fake", "OPENAI_ORG": ""}
+    st.secrets = secrets
+
+
+def install_fakes(api_latency: float) -> FakeOpenAI:
+    """
+    Replace the OpenAI API (and mdpdf if missing) with local fakes
+    :param api_latency: Latency of every fake API call in seconds
+    :return: Fake OpenAI backend
+    """
+    import app.page
+
+    share_runtime()
+
+    fake = FakeOpenAI(api_latency)
+    openai.ChatCompletion.create = fake
+
+    if shutil.which("mdpdf") is None:
+        app.page.questions_to_pdf = fake_questions_to_pdf
+
+    return fake
+
+
+class Session:
+    """
+    Simulated student session
+    """
+
+    def __init__(self, number: int, mode: str, timings: Dict[str, List[float]]):
+        self.random = random.Random(number)
+        self.mode = mode
+        self.timings = timings
+        self.at = AppTest.from_file(SCRIPT, default_timeout=120)
+
+    def run(self):
+        """
+        Run the full flow of the session
+        """
+        self.__render(self.at.run)
+
+        if self.mode == "generate":
+            self.at.text_input[0].input("Python, Algebra")
+            self.__click("Generate")
+            self.__click("Start exam")
+        else:
+            self.__click("Browse Questions")
+            # The generate sessions keep adding papers to the folder, so the listing can change
+            # between selecting a paper and clicking Go; select again like a user would
+            while self.at.title[0].value == "Question Browser":
+                papers = [option for option in self.at.selectbox[0].options if option.endswith(".json")]
+                self.__render(self.at.selectbox[0].set_value(self.random.choice(papers)).run)
+                self.__click("Go")
+
+        while True:
+            radio = self.at.radio[0]
+            self.__render(radio.set_value(self.random.choice(radio.options)).run)
+            if not self.__has_button("Next"):
+                break
+            self.__click("Next")
+
+        self.__click("Finish")
+        self.__click("Clarify the question")
+
+        if self.at.exception:
+            raise RuntimeError(self.at.exception[0].message)
+
+    def __has_button(self, label: str) -> bool:
+        return any(button.label == label for button in self.at.button)
+
+    def __click(self, label: str):
+        button = next(button for button in self.at.button if button.label == label)
+        self.__render(button.click().run)
+
+    def __render(self, action):
+        start = time.perf_counter()
+        action()
+        elapsed = time.perf_counter() - start
+
+        if self.at.exception:
+            raise RuntimeError(self.at.exception[0].message)
+
+        page = self.at.title[0].value if self.at.title else "Unknown"
+        self.timings[page].append(elapsed)
+
+
+def run_sessions(concurrency: int, sessions: int, mode: str, timings: Dict[str, List[float]]) -> List[str]:
+    """
+    Run a number of sessions with the given concurrency
+    :param concurrency: Number of simultaneous sessions
+    :param sessions: Total number of sessions
+    :param mode: Flow of the sessions (generate, browse or mixed)
+    :param timings: Render times by page, updated by the sessions
+    :return: Errors of the sessions that failed
+    """
+    modes = [mode if mode != "mixed" else ("generate", "browse")[number % 2] for number in range(sessions)]
+    simulated = [Session(number, modes[number], timings) for number in range(sessions)]
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(_run_session, simulated))
+
+    return [outcome for outcome in outcomes if outcome is not None]
+
+
+def run_level(concurrency: int, sessions: int, mode: str) -> Dict:
+    """
+    Run a level of the ramp: a timed pass, and a pass measuring the memory with tracemalloc (which
+    slows down the sessions too much to be part of the timed pass)
+    :param concurrency: Number of simultaneous sessions
+    :param sessions: Total number of sessions of the timed pass
+    :param mode: Flow of the sessions (generate, browse or mixed)
+    :return: Report of the level
+    """
+    timings = defaultdict(list)
+    start = time.perf_counter()
+    errors = run_sessions(concurrency, sessions, mode, timings)
+    elapsed = time.perf_counter() - start
+
+    # The sessions are gone once run_sessions returns, so the memory they hold is the peak reached
+    # while they run simultaneously
+    tracemalloc.start()
+    memory_before = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    run_sessions(concurrency, concurrency, mode, defaultdict(list))
+    memory_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "concurrency": concurrency,
+        "sessions": sessions,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "throughput": (sessions - len(errors)) / elapsed,
+        "memory_per_session_kb": (memory_peak - memory_before) / concurrency / 1024,
+        "pages": {
+            page: {"p50": percentile(values, 50), "p99": percentile(values, 99), "renders": len(values)}
+            for page, values in sorted(timings.items())
+        },
+    }
+
+
+def _run_session(session: Session):
+    try:
+        session.run()
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+    return None
+
+
+def compare(report: List[Dict], baseline: List[Dict], tolerance: float) -> List[str]:
+    """
+    Compare a report with a stored baseline
+    :param report: Report of the current run
+    :param baseline: Report of the baseline run
+    :param tolerance: Allowed relative regression (e.g. 0.2 for 20%)
+    :return: List of regressions found
+    """
+    regressions = []
+    baseline_levels = {level["concurrency"]: level for level in baseline}
+
+    for level in report:
+        previous = baseline_levels.get(level["concurrency"])
+        if previous is None:
+            continue
+
+        name = f"concurrency {level['concurrency']}"
+        if level["throughput"] < previous["throughput"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {level['throughput']:.2f} < {previous['throughput']:.2f} sessions/s")
+
+        if level["memory_per_session_kb"] > previous["memory_per_session_kb"] * (1 + tolerance):
+            regressions.append(
+                f"{name}: memory {level['memory_per_session_kb']:.0f} > {previous['memory_per_session_kb']:.0f} KB/session"
+            )
+
+        for page, timing in level["pages"].items():
+            previous_timing = previous["pages"].get(page)
+            if previous_timing and timing["p99"] > previous_timing["p99"] * (1 + tolerance):
+                regressions.append(
+                    f"{name}: {page} p99 {timing['p99'] * 1000:.0f} > {previous_timing['p99'] * 1000:.0f} ms"
+                )
+
+    return regressions
+
+
+def print_level(level: Dict):
+    print(
+        f"concurrency={level['concurrency']} sessions={level['sessions']} errors={level['errors']} "
+        f"throughput={level['throughput']:.2f} sessions/s memory={level['memory_per_session_kb']:.0f} KB/session"
+    )
+    if level["first_error"]:
+        print(f"    first error: {level['first_error']}")
+    for page, timing in level["pages"].items():
+        print(f"    {page:<20} p50={timing['p50'] * 1000:8.1f}ms p99={timing['p99'] * 1000:8.1f}ms renders={timing['renders']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the GPT QuestPro app with simulated sessions")
+    parser.add_argument("--ramp", default="1,2,4,8", help="Comma-separated concurrency levels")
+    parser.add_argument("--sessions", type=int, default=0, help="Sessions per level (default: 2 x concurrency)")
+    parser.add_argument("--mode", choices=("generate", "browse", "mixed"), default="mixed", help="Flow of the sessions")
+    parser.add_argument("--api-latency", type=float, default=0.5, help="Latency of the fake API in seconds")
+    parser.add_argument("--baseline", help="Baseline file to compare with")
+    parser.add_argument("--save-baseline", help="File to store the report as a new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    workdir = tempfile.mkdtemp(prefix="questpro-loadtest-")
+    shutil.copytree(os.path.join(ROOT, "Questions"), os.path.join(workdir, "Questions"))
+    cwd = os.getcwd()
+    os.chdir(workdir)
+
+    try:
+        fake = install_fakes(args.api_latency)
+        report = []
+        for concurrency in (int(level) for level in args.ramp.split(",")):
+            level = run_level(concurrency, args.sessions or 2 * concurrency, args.mode)
+            print_level(level)
+            report.append(level)
+        print(f"fake API calls: {fake.calls}")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import json
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+SNAPSHOT_VERSION = 1
+# Snapshots not written for this long (abandoned exams) are removed
+SNAPSHOT_MAX_AGE = 60 * 60 * 24 * 7
+# Seconds between two removals of the abandoned snapshots
+PURGE_INTERVAL = 60 * 60
+
+# A question is referenced by the paper it is stored in and its id inside that paper
+QuestionRef = Tuple[str, int]
+
+
+class Snapshot:
+    """
+    State of an exam in progress
+
+    Attributes:
+    - exam: Name of the exam
+    - refs: References to the questions of the exam, in order
+    - renumbered: Whether the questions are numbered by position instead of by their id
+    - answers: Index of the answer of every answered question by question index
+    - page: Current page
+    - number_of_question: Current question of the questions page
+    """
+
+    def __init__(self, exam: Optional[str] = None, renumbered: bool = False):
+        self.exam = exam
+        self.refs: List[QuestionRef] = []
+        self.renumbered = renumbered
+        self.answers: Dict[int, int] = {}
+        self.page = None
+        self.number_of_question = 0
+
+
+class SnapshotStore:
+    """
+    Store of the snapshots of the exams in progress, one file per session
+
+    A snapshot only references the stored papers instead of copying the questions. It is a
+    versioned header followed by one compact JSON record per line, appended as the exam goes on
+    (questions, answers, page changes), so recording an answer is a single small write. The
+    snapshot of a finished exam is deleted, and the ones of abandoned exams are removed once they
+    are older than max_age.
+    """
+
+    def __init__(self, folder_path: str, max_age: float = SNAPSHOT_MAX_AGE):
+        self.folder_path = folder_path
+        self.max_age = max_age
+        # Papers referenced by the snapshot of every session, in order (read again from the
+        # snapshot when a session is not in it)
+        self._papers: Dict[str, List[str]] = {}
+        self._purged = None
+
+    def path(self, session_id: str) -> str:
+        return os.path.join(self.folder_path, f"{session_id}.jsonl")
+
+    def start(self, session_id: str, exam: str, refs: List[QuestionRef], renumbered: bool = False):
+        """
+        Start the snapshot of a new exam, replacing the previous one of the session
+        :param session_id: Id of the session
+        :param exam: Name of the exam
+        :param refs: References to the questions of the exam
+        :param renumbered: Whether the questions are numbered by position instead of by their id
+        """
+        os.makedirs(self.folder_path, exist_ok=True)
+        self.purge()
+
+        papers = []
+        records = [{"v": SNAPSHOT_VERSION, "exam": exam, "renumbered": renumbered}]
+        for paper, question_id in refs:
+            if paper not in papers:
+                papers.append(paper)
+                records.append({"f": paper})
+            records.append({"q": [papers.index(paper), question_id]})
+
+        with open(self.path(session_id), "w", encoding="utf-8") as f:
+            f.write("".join(self.__dump(record) for record in records))
+        self._papers[session_id] = papers
+
+    def add_question(self, session_id: str, ref: QuestionRef):
+        """
+        Add a question to the snapshot
+        :param session_id: Id of the session
+        :param ref: Reference to the question
+        """
+        paper, question_id = ref
+        if session_id not in self._papers and self.load(session_id) is None:
+            return
+
+        papers = self._papers[session_id]
+        records = []
+        if paper not in papers:
+            papers.append(paper)
+            records.append({"f": paper})
+        records.append({"q": [papers.index(paper), question_id]})
+
+        self.__append(session_id, records)
+
+    def record_answer(self, session_id: str, question_index: int, answer_index: int):
+        self.__append(session_id, [{"a": [question_index, answer_index]}])
+
+    def record_page(self, session_id: str, page: int):
+        self.__append(session_id, [{"p": page}])
+
+    def record_question_number(self, session_id: str, number_of_question: int):
+        self.__append(session_id, [{"n": number_of_question}])
+
+    def load(self, session_id: str) -> Optional[Snapshot]:
+        """
+        Load the snapshot of a session
+        :param session_id: Id of the session
+        :return: Snapshot, None if there is none or its version is not supported
+        """
+        try:
+            with open(self.path(session_id), "r", encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return None
+
+        try:
+            header = json.loads(lines[0])
+        except (IndexError, json.JSONDecodeError):
+            return None
+
+        if header.get("v") != SNAPSHOT_VERSION:
+            return None
+
+        snapshot = Snapshot(header["exam"], header["renumbered"])
+        papers = []
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A write interrupted by a crash: only that record is lost
+                continue
+
+            if "f" in record:
+                papers.append(record["f"])
+            elif "q" in record:
+                snapshot.refs.append((papers[record["q"][0]], record["q"][1]))
+            elif "a" in record:
+                snapshot.answers[record["a"][0]] = record["a"][1]
+            elif "p" in record:
+                snapshot.page = record["p"]
+            elif "n" in record:
+                snapshot.number_of_question = record["n"]
+
+        self._papers[session_id] = papers
+        return snapshot
+
+    def delete(self, session_id: str):
+        self._papers.pop(session_id, None)
+        if os.path.isfile(self.path(session_id)):
+            os.remove(self.path(session_id))
+
+    def purge(self):
+        """
+        Remove the snapshots older than max_age, and forget the papers of the removed snapshots, at
+        most once every PURGE_INTERVAL seconds
+        """
+        now = time.time()
+        if self._purged is not None and now - self._purged < PURGE_INTERVAL:
+            return
+        self._purged = now
+
+        try:
+            file_names = os.listdir(self.folder_path)
+        except OSError:
+            return
+
+        for file_name in file_names:
+            path = os.path.join(self.folder_path, file_name)
+            try:
+                if file_name.endswith(".jsonl") and now - os.path.getmtime(path) > self.max_age:
+                    os.remove(path)
+            except OSError:
+                continue
+
+        for session_id in list(self._papers):
+            if not os.path.isfile(self.path(session_id)):
+                self._papers.pop(session_id, None)
+
+    def __append(self, session_id: str, records: List[Dict]):
+        if not os.path.isfile(self.path(session_id)):
+            return
+
+        with open(self.path(session_id), "a", encoding="utf-8") as f:
+            f.write("".join(self.__dump(record) for record in records))
+
+    @staticmethod
+    def __dump(record: Dict) -> str:
+        return json.dumps(record, separators=(",", ":")) + "\n"
@@ -0,0 +1,188 @@
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from model.question import Question
+from utils.api import normalize_topics
+
+# An exam is identified by its normalized topics, number of questions and number of answers
+ExamKey = Tuple[str, int, int]
+
+
+class WarmPool:
+    """
+    Pool of pre-generated exams for the most requested topics
+
+    Every request is counted, and a background worker uses the idle time (no request in the
+    last idle_seconds and no generation in progress) to keep up to pool_size fresh, unused
+    exams for each of the most popular topic/size combinations. A request for one of them is
+    served instantly from the pool, and the pool is refilled asynchronously. The counts halve
+    every half_life seconds, so a combination that is no longer requested stops being refilled
+    and is eventually forgotten.
+
+    The pool is refilled with refill (generate by default), which must not share its result with
+    any request (e.g. by coalescing identical calls), or a pooled exam would be given to a student
+    who already got the same questions.
+    """
+
+    def __init__(
+            self,
+            generate: Callable[[str, int, int], List[Question]],
+            pool_size: int = 2,
+            popular_topics: int = 3,
+            min_requests: int = 2,
+            max_age: float = 60 * 60 * 24,
+            idle_seconds: float = 5.0,
+            half_life: float = 60 * 60 * 6,
+            refill: Optional[Callable[[str, int, int], List[Question]]] = None,
+    ):
+        self.generate = generate
+        self.refill = refill or generate
+        self.pool_size = pool_size
+        self.popular_topics = popular_topics
+        self.min_requests = min_requests
+        self.max_age = max_age
+        self.idle_seconds = idle_seconds
+        self.half_life = half_life
+
+        # Decayed number of requests of every exam and time of its last update
+        self.requests: Dict[ExamKey, Tuple[float, float]] = {}
+        self._topics: Dict[ExamKey, str] = {}
+        self._pools: Dict[ExamKey, Deque[Tuple[float, List[Question]]]] = {}
+        self._in_progress = 0
+        self._last_request = 0.0
+        self._lock = threading.Lock()
+        self._wake_up = threading.Event()
+        self._stop = threading.Event()
+        self._worker = None
+
+    def get_questions(self, topics: str, number_of_questions: int, number_of_answers: int) -> List[Question]:
+        """
+        Get an exam from the pool, generating it if there is none available
+        :param topics: Topics to include in the exam
+        :param number_of_questions: Number of questions
+        :param number_of_answers: Number of answers
+        :return: List of questions
+        """
+        questions = self.take(topics, number_of_questions, number_of_answers)
+        if questions is not None:
+            return questions
+
+        with self._lock:
+            self._in_progress += 1
+        try:
+            return self.generate(topics, number_of_questions, number_of_answers)
+        finally:
+            with self._lock:
+                self._in_progress -= 1
+                self._last_request = time.monotonic()
+
+    def take(self, topics: str, number_of_questions: int, number_of_answers: int) -> Optional[List[Question]]:
+        """
+        Record a request and take a fresh exam from the pool
+        :param topics: Topics to include in the exam
+        :param number_of_questions: Number of questions
+        :param number_of_answers: Number of answers
+        :return: List of questions, None if there is no exam available
+        """
+        key = (normalize_topics(topics), int(number_of_questions), int(number_of_answers))
+
+        with self._lock:
+            self.requests[key] = (self.__count(key) + 1, time.monotonic())
+            self._topics.setdefault(key, topics)
+            self._last_request = time.monotonic()
+            self.__discard_stale()
+
+            pool = self._pools.get(key)
+            questions = pool.popleft()[1] if pool else None
+
+        self.__start_worker()
+        self._wake_up.set()
+        return questions
+
+    def size(self, topics: str, number_of_questions: int, number_of_answers: int) -> int:
+        """
+        Number of exams available in the pool for the given parameters
+        """
+        key = (normalize_topics(topics), int(number_of_questions), int(number_of_answers))
+        with self._lock:
+            return len(self._pools.get(key, ()))
+
+    def stop(self):
+        """
+        Stop the background worker, no more exams are generated for the pool
+        """
+        self._stop.set()
+        self._wake_up.set()
+
+    def __start_worker(self):
+        with self._lock:
+            if self._worker is None and not self._stop.is_set():
+                self._worker = threading.Thread(target=self.__run, name="warm-pool", daemon=True)
+                self._worker.start()
+
+    def __run(self):
+        while not self._stop.is_set():
+            self._wake_up.wait(timeout=self.idle_seconds)
+            self._wake_up.clear()
+            if self._stop.is_set():
+                return
+
+            key = self.__next_to_fill()
+            if key is None:
+                continue
+
+            try:
+                questions = self.refill(self._topics[key], key[1], key[2])
+            except Exception as e:
+                print(e)
+                continue
+
+            with self._lock:
+                # The exam may have been forgotten while it was being generated
+                if key not in self.requests or self._stop.is_set():
+                    continue
+                self._pools.setdefault(key, deque()).append((time.monotonic(), questions))
+
+            self._wake_up.set()
+
+    def __next_to_fill(self) -> Optional[ExamKey]:
+        """
+        Find the popular exam whose pool is not full, if the app is idle
+        """
+        with self._lock:
+            if self._in_progress or time.monotonic() - self._last_request < self.idle_seconds:
+                return None
+
+            self.__discard_stale()
+            self.__forget_unpopular()
+
+            counts = sorted(((self.__count(key), key) for key in self.requests), reverse=True)
+            for count, key in counts[:self.popular_topics]:
+                if count >= self.min_requests and len(self._pools.get(key, ())) < self.pool_size:
+                    return key
+
+        return None
+
+    def __count(self, key: ExamKey) -> float:
+        """
+        Number of requests of an exam, halved for every half life elapsed since its last request
+        """
+        count, updated = self.requests.get(key, (0.0, time.monotonic()))
+        return count * 0.5 ** ((time.monotonic() - updated) // self.half_life)
+
+    def __forget_unpopular(self):
+        """
+        Forget the exams whose decayed number of requests is negligible, with their pooled exams
+        """
+        for key in [key for key in self.requests if self.__count(key) < 0.1]:
+            del self.requests[key]
+            self._topics.pop(key, None)
+            self._pools.pop(key, None)
+
+    def __discard_stale(self):
+        now = time.monotonic()
+        for pool in self._pools.values():
+            while pool and now - pool[0][0] > self.max_age:
+                pool.popleft()